@@ -0,0 +1,142 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from search_client import KeyPool, search_pages
+
+
+class NewsSource(ABC):
+    """This class is the interface of a news source, the calls the pipeline makes."""
+
+    @abstractmethod
+    def search_pages(self, q: str, from_: str, to_: str, lang: str = 'en', page_size: int = 100):
+        """This function fetches the search result pages.
+
+        :param q: The search query.
+        :param from_: The first date, YYYY/mm/dd.
+        :param to_: The last date, YYYY/mm/dd.
+        :param lang: The language of the articles.
+        :param page_size: The number of articles per page.
+        :return: A generator of the articles list of each page.
+        """
+
+
+class NewsCatcherSource(NewsSource):
+    """This class searches the live newscatcherapi, rotating across the API keys.
+
+    :param keys: The API keys.
+    """
+
+    def __init__(self, keys: list):
+        self.pool = KeyPool(keys=keys)
+
+    def search_pages(self, q: str, from_: str, to_: str, lang: str = 'en', page_size: int = 100):
+        yield from search_pages(pool=self.pool, q=q, from_=from_, to_=to_, lang=lang, page_size=page_size)
+
+
+def get_fixture_path(path: str, q: str, from_: str) -> str:
+    """This function gets the fixture file of a search.
+
+    :param path: The fixtures directory.
+    :param q: The search query.
+    :param from_: The first date, YYYY/mm/dd.
+    :return: The path of the fixture file, named like the articles collection.
+    """
+
+    # Convert date and query like the collection names
+    date_string = from_.replace('/', '')
+    technology_string = q.lower().replace(' ', '_').replace('/', '_')
+
+    return os.path.join(path, f'{date_string}_{technology_string}.json')
+
+
+class FixtureNewsSource(NewsSource):
+    """This class replays searches recorded as JSON files, one list of pages per technology and date.
+
+    :param path: The fixtures directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def search_pages(self, q: str, from_: str, to_: str, lang: str = 'en', page_size: int = 100):
+        # Get fixture file
+        fixture_path = get_fixture_path(path=self.path, q=q, from_=from_)
+
+        # A search that was never recorded has no articles
+        if not os.path.exists(fixture_path):
+            return
+
+        with open(fixture_path, encoding='utf-8') as f:
+            pages = json.load(f)
+
+        yield from pages
+
+
+class RecordingNewsSource(NewsSource):
+    """This class searches another news source and records every search as a fixture file to replay later.
+
+    :param source: The news source.
+    :param path: The fixtures directory.
+    """
+
+    def __init__(self, source: NewsSource, path: str):
+        self.source = source
+        self.path = path
+
+    def search_pages(self, q: str, from_: str, to_: str, lang: str = 'en', page_size: int = 100):
+        # The pages recorded so far
+        pages = []
+
+        for page in self.source.search_pages(q=q, from_=from_, to_=to_, lang=lang, page_size=page_size):
+            pages.append(page)
+            yield page
+
+        # Record the search once every page arrived
+        os.makedirs(self.path, exist_ok=True)
+        with open(get_fixture_path(path=self.path, q=q, from_=from_), 'w', encoding='utf-8') as f:
+            json.dump(pages, f)
+
+
+def create_news_source(name: str, keys: list) -> NewsSource:
+    """This function creates the news source from its configuration.
+
+    :param name: 'newscatcherapi', 'fixtures:<directory>' or 'record:<directory>'.
+    :param keys: The newscatcherapi keys.
+    :return: The news source.
+    """
+
+    # Replay recorded searches
+    if name.startswith('fixtures:'):
+        return FixtureNewsSource(path=name[len('fixtures:'):])
+
+    # Search the live newscatcherapi and record every search
+    if name.startswith('record:'):
+        return RecordingNewsSource(source=NewsCatcherSource(keys=keys), path=name[len('record:'):])
+
+    return NewsCatcherSource(keys=keys)
+
+
+def create_client(name: str, connection_string: str):
+    """This function creates the document store client from its configuration.
+
+    :param name: 'atlas' for mongoDB Atlas, or 'mongomock' for an in-memory store with the same calls.
+    :param connection_string: The mongoDB connection string.
+    :return: The client.
+    """
+
+    # In-memory document store for development and benchmarks
+    if name == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            raise ImportError('The mongomock document store needs the mongomock package, pip install mongomock.')
+
+        # Let GridFS store the co-occurrence matrices in the in-memory store too
+        from mongomock.gridfs import enable_gridfs_integration
+        enable_gridfs_integration()
+
+        return mongomock.MongoClient()
+
+    from pymongo import MongoClient
+
+    return MongoClient(connection_string)
@@ -0,0 +1,145 @@
+import os
+import time
+import argparse
+from pipeline import *
+from ner import TIERS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def get_dates(start: datetime.date, end: datetime.date) -> list:
+    """This function gets every date between two dates.
+
+    :param start: The first date.
+    :param end: The last date, included.
+    :return: The dates.
+    """
+
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def expand_technologies(names: list) -> list:
+    """This function expands technology names to the subfields that are searched.
+
+    :param names: The technology or subfield names, every subfield if empty.
+    :return: The subfield names.
+    """
+
+    # Every subfield of every technology
+    if not names:
+        names = list(TECHNOLOGIES)
+
+    # The subfields, without duplicates
+    subfields = []
+
+    for name in names:
+        # A technology stands for all of its subfields
+        for subfield in TECHNOLOGIES.get(name, (name,)):
+            if subfield not in subfields:
+                subfields.append(subfield)
+
+    return subfields
+
+
+def run_batch(dates: list, technologies: list, workers: int = 2, batch_size: int = DEFAULT_BATCH_SIZE,
+              n_process: int = None, tier: str = DEFAULT_TIER) -> None:
+    """This function precomputes the articles and prediction collections of every technology on every date.
+
+    Predictions that already finished are skipped, so an interrupted batch resumes where it left off.
+
+    :param dates: The dates.
+    :param technologies: The technologies.
+    :param workers: The number of technology/date pairs computed at the same time.
+    :param batch_size: The number of article texts spaCy processes together.
+    :param n_process: The number of NER worker processes, shared by every pair, defaults to the number of cores.
+    :param tier: The NER speed tier, 'gazetteer', 'small' or 'large'.
+    """
+
+    # The pairs computed at the same time share one worker pool of this size, so it uses every core
+    if n_process is None:
+        n_process = os.cpu_count() or 1
+
+    # Skip the pairs whose prediction finished, even without companies
+    jobs = [
+        (date, technology) for date in dates for technology in technologies
+        if not prediction_completed(date=date, technology=technology)
+    ]
+
+    print(f'{len(dates) * len(technologies) - len(jobs)} predictions already computed, {len(jobs)} to compute.')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Start every job
+        futures = {}
+        for date, technology in jobs:
+            future = executor.submit(
+                compute_prediction,
+                date=date,
+                technology=technology,
+                batch_size=batch_size,
+                n_process=n_process,
+                tier=tier
+            )
+            futures[future] = (date, technology, time.monotonic())
+
+        # Display progress as each job finishes
+        for done, future in enumerate(as_completed(futures), start=1):
+            date, technology, start = futures[future]
+            name = get_collection_name(date=date, technology=technology)
+
+            try:
+                companies = future.result()
+            except Exception as e:
+                print(f'[{done}/{len(jobs)}] {name}: failed ({e!r})')
+                continue
+
+            print(f'[{done}/{len(jobs)}] {name}: {len(companies)} companies ({time.monotonic() - start:.1f}s)')
+
+
+def main():
+    # Command line arguments
+    parser = argparse.ArgumentParser(description='Precompute predictions for a date range and technologies.')
+    parser.add_argument('--start', type=date.fromisoformat, help='The first date, YYYY-MM-DD.')
+    parser.add_argument('--end', type=date.fromisoformat, help='The last date, YYYY-MM-DD, defaults to --start.')
+    parser.add_argument('--technologies', nargs='*', default=[],
+                        help='The technologies or subfields, every subfield by default.')
+    parser.add_argument('--workers', type=int, default=2, help='The number of pairs computed at the same time.')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='The number of article texts spaCy processes together.')
+    parser.add_argument('--n-process', type=int, help='The number of NER worker processes, shared by every pair.')
+    parser.add_argument('--tier', choices=TIERS, default=DEFAULT_TIER,
+                        help='The NER speed tier, gazetteer and small are faster, large is more accurate.')
+    parser.add_argument('--repair-series', action='store_true',
+                        help='Recompute the prefix sums of the company series of the technologies afterwards, '
+                             'after the app computed predictions of the same technologies at the same time.')
+    parser.add_argument('--update-gazetteer', action='store_true',
+                        help='Write the gazetteer of the company names of every stored prediction first.')
+    args = parser.parse_args()
+
+    # Compile the companies found so far for the gazetteer tier
+    if args.update_gazetteer:
+        print(f'{update_gazetteer()} company names written to {get_gazetteer_path()}.')
+
+        # Only update the gazetteer
+        if args.start is None:
+            return
+
+    if args.start is None:
+        parser.error('the following arguments are required: --start')
+
+    # Compute predictions
+    run_batch(
+        dates=get_dates(start=args.start, end=args.end or args.start),
+        technologies=expand_technologies(args.technologies),
+        workers=args.workers,
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+        tier=args.tier
+    )
+
+    # Correct the series written by other processes at the same time
+    if args.repair_series:
+        for technology in expand_technologies(args.technologies):
+            print(f'{technology}: {repair_series(technology=technology)} series points corrected.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import sys
+import random
+import argparse
+import subprocess
+import tempfile
+import threading
+import psutil
+from datetime import date, timedelta
+from itertools import islice
+
+# The technology searched by the benchmark
+TECHNOLOGY = 'Quantum computing'
+
+# The companies mentioned in the synthetic articles
+COMPANIES = (
+    'Lockheed Martin', 'Raytheon Technologies', 'Northrop Grumman', 'General Dynamics', 'Boeing', 'IBM',
+    'Google', 'Microsoft', 'Amazon Web Services', 'Intel', 'NVIDIA', 'Honeywell', 'Palantir', 'Anduril Industries',
+    'SpaceX', 'Blue Origin', 'Huawei', 'Tencent', 'Baidu', 'Samsung', 'Rigetti Computing', 'IonQ', 'D-Wave Systems'
+)
+
+# The companies of the corpus the gazetteer is compiled from, the others only appear in the benchmarked corpus, as
+# companies that are new in the news are missing from a gazetteer of the stored predictions
+GAZETTEER_COMPANIES = COMPANIES[:16]
+
+# The sentences of the synthetic articles
+SENTENCES = (
+    '{company} announced a new {technology} program on Tuesday.',
+    'Analysts said {company} could lead the market for {technology} within five years.',
+    'The contract awarded to {company} covers research, development and testing.',
+    'Shares of {company} rose 3 percent after the announcement.',
+    'A spokesperson for {company} declined to comment on the deal.',
+    'The Department of Defense is expected to expand its investment in {technology}.',
+    'Researchers at the university partnered with {company} and {other} on the project.',
+    'The company reported revenue of $4.2 billion for the quarter.',
+    'Investors from overseas have taken a growing interest in {technology} startups.',
+    'The new facility will employ about 300 engineers and technicians.'
+)
+
+# The sizes of the synthetic corpora
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+
+# The modules the app imports before it renders the first page
+STARTUP_MODULES = ('utils', 'pipeline')
+
+# The heavy modules that must only be imported on first use
+LAZY_MODULES = ('spacy', 'newspaper', 'aiohttp', 'mongomock', 'scipy', 'sklearn')
+
+# The seconds the app may take to import
+DEFAULT_STARTUP_BUDGET = 1.0
+
+# The script timing the imports in a fresh interpreter
+STARTUP_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def generate_corpus(size: int, technology: str = TECHNOLOGY, seed: int = 0, companies: tuple = COMPANIES) -> list:
+    """This function generates synthetic newscatcherapi articles with their texts.
+
+    :param size: The number of articles.
+    :param technology: The technology the articles are about.
+    :param seed: The random seed, the same seed always gives the same corpus.
+    :param companies: The companies mentioned in the articles.
+    :return: The articles, each with a 'text' field holding the article text.
+    """
+
+    # The random generator
+    generator = random.Random(seed)
+
+    # The articles
+    articles = []
+
+    for i in range(size):
+        # Write the article text
+        sentences = [
+            generator.choice(SENTENCES).format(
+                company=generator.choice(companies),
+                other=generator.choice(companies),
+                technology=technology.lower()
+            )
+            for _ in range(generator.randint(10, 40))
+        ]
+        text = ' '.join(sentences)
+
+        articles.append({
+            'title': f'{sentences[0][:60]} ({i})',
+            'summary': ' '.join(sentences[:3]),
+            'link': f'https://news.example.com/{seed}/{size}/{i}',
+            'clean_url': 'news.example.com',
+            'published_date': '2022-07-01 12:00:00',
+            'text': text
+        })
+
+    return articles
+
+
+class PeakMemory:
+    """This class samples the resident memory of the process in the background and keeps the peak.
+
+    :param interval: The seconds between two samples.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def run_stage(name: str, size: int, items) -> dict:
+    """This function times a pipeline stage.
+
+    :param name: The name of the stage.
+    :param size: The number of articles of the corpus.
+    :param items: The iterable of the stage, one item per article.
+    :return: The number of articles, seconds, articles per second, time to first result and peak resident memory.
+    """
+
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        first = None
+        count = 0
+
+        for _ in items:
+            # The first result of the stage
+            if first is None:
+                first = time.perf_counter() - start
+
+            count += 1
+
+        seconds = time.perf_counter() - start
+
+    return {
+        'size': size,
+        'stage': name,
+        'articles': count,
+        'seconds': seconds,
+        'articles_per_second': count / seconds if seconds else 0.0,
+        'time_to_first_result': first,
+        'peak_rss_bytes': memory.peak
+    }
+
+
+def benchmark_size(size: int, day: date, n_process: int = None, fixtures_path: str = None) -> list:
+    """This function benchmarks every pipeline stage on a synthetic corpus.
+
+    :param size: The number of articles.
+    :param day: The date the articles are stored under, one per corpus so corpora never mix.
+    :param n_process: The number of NER worker processes.
+    :param fixtures_path: The directory of the recorded searches.
+    :return: The results of each stage.
+    """
+
+    from backends import get_fixture_path
+    from ner import iter_companies_batch, load_model, DEFAULT_BATCH_SIZE
+    from pipeline import (stream_prediction, store_documents, get_article_texts, get_text_cache, get_collection_name,
+                          get_relevance_filter)
+
+    # Generate corpus
+    corpus = generate_corpus(size=size, seed=size)
+    articles = [{k: v for k, v in article.items() if k != 'text'} for article in corpus]
+    texts = [article['text'] for article in corpus]
+    links = [article['link'] for article in corpus]
+
+    # Seed the article text cache, as if every article had been downloaded before
+    cache = get_text_cache()
+    for article in corpus:
+        cache.put(article['link'], article['text'])
+
+    # The results of each stage
+    results = []
+
+    # Stage: store articles
+    def store():
+        articles_iterator = iter(articles)
+
+        for chunk in iter(lambda: list(islice(articles_iterator, 1000)), []):
+            store_documents(documents=chunk, collection_name=get_collection_name(date=day, technology='store'))
+            yield from chunk
+
+    results.append(run_stage('store', size, store()))
+
+    # Stage: article texts, every one from the cache
+    results.append(run_stage('text', size, get_article_texts(links, cache=cache)))
+
+    # Stage: Name Entity Recognition
+    nlp = load_model()
+    tokens = sum(len(doc) for doc in nlp.tokenizer.pipe(texts))
+    result = run_stage('ner', size, iter_companies_batch(texts, batch_size=DEFAULT_BATCH_SIZE, n_process=n_process))
+    result['tokens'] = tokens
+    result['tokens_per_second'] = tokens / result['seconds'] if result['seconds'] else 0.0
+    results.append(result)
+
+    # Stage: Name Entity Recognition of the passages about the technology only
+    relevant_texts = [get_relevance_filter(TECHNOLOGY).filter(text) for text in texts]
+    relevant_tokens = sum(len(doc) for doc in nlp.tokenizer.pipe(relevant_texts))
+    result = run_stage('relevant', size, iter_companies_batch(relevant_texts, batch_size=DEFAULT_BATCH_SIZE,
+                                                              n_process=n_process))
+    result['tokens'] = relevant_tokens
+    result['tokens_per_second'] = relevant_tokens / result['seconds'] if result['seconds'] else 0.0
+    result['reduction_ratio'] = tokens / relevant_tokens if relevant_tokens else None
+    results.append(result)
+
+    # Record the search of the end to end stage as a fixture
+    from_ = day.strftime('%Y/%m/%d')
+    pages = [articles[i:i + 100] for i in range(0, len(articles), 100)]
+    with open(get_fixture_path(path=fixtures_path, q=TECHNOLOGY, from_=from_), 'w', encoding='utf-8') as f:
+        json.dump(pages, f)
+
+    # Stage: end to end, from the recorded search to running company counts
+    results.append(run_stage('pipeline', size, stream_prediction(date=day, technology=TECHNOLOGY, n_process=n_process)))
+
+    return results
+
+
+def benchmark_tiers(size: int, n_process: int = None, gazetteer_path: str = None) -> list:
+    """This function benchmarks the throughput of every NER speed tier and its recall against the large model.
+
+    The gazetteer is compiled from the companies the large model finds in another corpus, as batch.py compiles it
+    from the stored predictions. That corpus only mentions part of the companies, so the recall of the gazetteer
+    counts the companies it has never seen.
+
+    :param size: The number of articles.
+    :param n_process: The number of NER worker processes.
+    :param gazetteer_path: The path the gazetteer is written to.
+    :return: The results of each tier, with the share of the large model's companies of each article it found.
+    """
+
+    from ner import iter_companies_batch, load_model, write_gazetteer, get_model_name, TIERS, DEFAULT_BATCH_SIZE
+
+    # Generate corpus
+    texts = [article['text'] for article in generate_corpus(size=size, seed=size)]
+
+    # Compile the gazetteer from the companies found in another corpus, without the companies new in this one
+    reference_texts = [
+        article['text'] for article in generate_corpus(size=size, seed=size + 1, companies=GAZETTEER_COMPANIES)
+    ]
+    write_gazetteer(
+        (name for partial in iter_companies_batch(reference_texts, n_process=n_process) for name in partial),
+        gazetteer_path
+    )
+
+    # Count tokens
+    tokens = sum(len(doc) for doc in load_model().tokenizer.pipe(texts))
+
+    # The companies of each article found by the large model
+    reference = None
+
+    # The results of each tier
+    results = []
+
+    # Run the large model first, it is the reference
+    for tier in sorted(TIERS, key=lambda t: t != 'large'):
+        model_name = get_model_name(tier)
+
+        # Load the pipeline before timing, as the app does on its first request
+        if n_process == 1:
+            load_model(model_name)
+
+        # Keep the companies of each article
+        partials = []
+        items = iter_companies_batch(texts, batch_size=DEFAULT_BATCH_SIZE, n_process=n_process, model_name=model_name)
+        result = run_stage(tier, size, (partials.append(partial) for partial in items))
+
+        # The companies of each article
+        found = {(i, name) for i, partial in enumerate(partials) for name in partial}
+        if reference is None:
+            reference = found
+
+        result['tokens'] = tokens
+        result['tokens_per_second'] = tokens / result['seconds'] if result['seconds'] else 0.0
+        result['recall'] = len(found & reference) / len(reference) if reference else None
+        results.append(result)
+
+    return results
+
+
+def check_startup(budget: float = DEFAULT_STARTUP_BUDGET) -> dict:
+    """This function times the import of the app in a fresh interpreter, without a database or a model.
+
+    :param budget: The seconds the import may take.
+    :return: The import seconds, the heavy modules that were loaded and if the startup is within budget.
+    """
+
+    # Import the app as streamlit would, against the in-memory document store
+    script = STARTUP_SCRIPT.format(modules=STARTUP_MODULES, lazy=LAZY_MODULES)
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        env={**os.environ, 'DOCUMENT_STORE': 'mongomock'},
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+
+    # The last line is the result, streamlit may warn before it
+    result = json.loads(output.strip().splitlines()[-1])
+    result['budget'] = budget
+    result['ok'] = result['seconds'] <= budget and not result['loaded']
+
+    return result
+
+
+def format_results(results: list) -> str:
+    """This function formats the benchmark results as a table.
+
+    :param results: The results of each stage.
+    :return: The table.
+    """
+
+    # The table header
+    lines = [f'{"size":>7} {"stage":<9} {"seconds":>9} {"articles/s":>11} {"tokens/s":>10} {"first (s)":>10} '
+             f'{"peak RSS (MB)":>14} {"recall":>7}']
+
+    for result in results:
+        tokens_per_second = f'{result["tokens_per_second"]:>10.0f}' if 'tokens_per_second' in result else f'{"-":>10}'
+        first = f'{result["time_to_first_result"]:>10.3f}' if result['time_to_first_result'] is not None \
+            else f'{"-":>10}'
+        recall = f'{result["recall"]:>7.3f}' if result.get('recall') is not None else f'{"-":>7}'
+
+        lines.append(f'{result["size"]:>7} {result["stage"]:<9} {result["seconds"]:>9.2f} '
+                     f'{result["articles_per_second"]:>11.0f} {tokens_per_second} {first} '
+                     f'{result["peak_rss_bytes"] / 1024 ** 2:>14.0f} {recall}')
+
+    return '\n'.join(lines)
+
+
+def main():
+    # Command line arguments
+    parser = argparse.ArgumentParser(description='Benchmark the prediction pipeline on synthetic corpora, offline.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='The numbers of articles.')
+    parser.add_argument('--n-process', type=int, default=1, help='The number of NER worker processes.')
+    parser.add_argument('--output', help='The JSON file to write the results to.')
+    parser.add_argument('--tiers', action='store_true',
+                        help='Compare the throughput and recall of the NER speed tiers instead of the stages.')
+    parser.add_argument('--startup', action='store_true', help='Only check the app imports within the budget.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_STARTUP_BUDGET, help='The import budget in seconds.')
+    args = parser.parse_args()
+
+    # Check the app starts without loading spaCy, newspaper or the database client
+    if args.startup:
+        result = check_startup(budget=args.budget)
+
+        print(f'import {", ".join(STARTUP_MODULES)}: {result["seconds"]:.2f} s (budget {result["budget"]:.2f} s)')
+        if result['loaded']:
+            print(f'loaded on import: {", ".join(result["loaded"])}')
+
+        sys.exit(0 if result['ok'] else 1)
+
+    # Run against the in-memory document store, the recorded searches and a temporary article text cache
+    directory = tempfile.mkdtemp(prefix='predictive_analysis_benchmark_')
+    fixtures_path = os.path.join(directory, 'fixtures')
+    os.makedirs(fixtures_path)
+    os.environ['DOCUMENT_STORE'] = 'mongomock'
+    os.environ['NEWS_SOURCE'] = f'fixtures:{fixtures_path}'
+    os.environ['TEXT_CACHE_PATH'] = os.path.join(directory, 'articles.sqlite')
+    os.environ['GAZETTEER_PATH'] = os.path.join(directory, 'gazetteer.txt')
+
+    # The results of every corpus
+    results = []
+
+    for i, size in enumerate(args.sizes):
+        # Compare the NER speed tiers on the same corpus
+        if args.tiers:
+            results += benchmark_tiers(size=size, n_process=args.n_process, gazetteer_path=os.environ['GAZETTEER_PATH'])
+            continue
+
+        results += benchmark_size(
+            size=size,
+            day=date(2000, 1, 1) + timedelta(days=i),
+            n_process=args.n_process,
+            fixtures_path=fixtures_path
+        )
+
+    print(format_results(results))
+
+    # Write results
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+import os
+import csv
+import zlib
+import argparse
+import numpy as np
+from resolution import normalize_name, get_trigrams
+
+# The directory of the CAGE index
+DEFAULT_PATH = '.cache/cage'
+
+# The columns of the registry extract
+DEFAULT_CAGE_COLUMN = 'CAGE Code'
+DEFAULT_NAME_COLUMN = 'Legal Business Name'
+DEFAULT_ZIP_COLUMN = 'Physical Address Zip/Postal Code'
+DEFAULT_COUNTRY_COLUMN = 'Physical Address Country Code'
+DEFAULT_ADDRESS_COLUMNS = (
+    'Physical Address Line 1',
+    'Physical Address City',
+    'Physical Address Province or State',
+    DEFAULT_ZIP_COLUMN,
+    DEFAULT_COUNTRY_COLUMN
+)
+
+# The share of trigrams a company and a registered entity must have in common to match
+DEFAULT_THRESHOLD = 0.6
+
+# The number of registry rows written at once while building the index
+CHUNK_ROWS = 100000
+
+# The files of the index
+FILES = ('cage.npy', 'trigram_counts.npy', 'name_offsets.npy', 'names.bin', 'address_offsets.npy', 'addresses.bin',
+         'zips.npy', 'countries.npy', 'name_keys.npy', 'name_rows.npy', 'keys.npy', 'indptr.npy', 'indices.npy')
+
+
+def get_trigram_keys(normalized: str) -> np.ndarray:
+    """This function gets the 32 bit keys of the trigrams of a normalized name.
+
+    :param normalized: The normalized name.
+    :return: The unique keys, sorted.
+    """
+
+    return np.unique(np.array([zlib.crc32(t.encode('utf-8')) for t in get_trigrams(normalized)], dtype=np.uint32))
+
+
+def get_name_key(normalized: str) -> int:
+    """This function gets the 32 bit key of a normalized name, for the exact matches.
+
+    :param normalized: The normalized name.
+    :return: The key.
+    """
+
+    return zlib.crc32(normalized.encode('utf-8'))
+
+
+def read_registry(path: str, cage_column: str = DEFAULT_CAGE_COLUMN, name_column: str = DEFAULT_NAME_COLUMN,
+                  address_columns=DEFAULT_ADDRESS_COLUMNS, zip_column: str = DEFAULT_ZIP_COLUMN,
+                  country_column: str = DEFAULT_COUNTRY_COLUMN, delimiter: str = ','):
+    """This function reads a CAGE/SAM registry extract one row at a time.
+
+    :param path: The CSV file of the extract, with a header.
+    :param cage_column: The column of the CAGE code.
+    :param name_column: The column of the legal business name.
+    :param address_columns: The columns joined into the address.
+    :param zip_column: The column of the ZIP code.
+    :param country_column: The column of the country code.
+    :param delimiter: The delimiter, '|' for the SAM public extract.
+    :return: A generator of (CAGE code, name, address, ZIP code, country code).
+    """
+
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            # Skip the entities without a CAGE code
+            if not row.get(cage_column) or not row.get(name_column):
+                continue
+
+            address = ', '.join(row[column].strip() for column in address_columns if row.get(column, '').strip())
+
+            yield (row[cage_column].strip(), row[name_column].strip(), address, (row.get(zip_column) or '').strip(),
+                   (row.get(country_column) or '').strip())
+
+
+def _write_strings(f, strings: list, offset: int) -> (list, int):
+    # Append the strings to a blob and get where each one ends
+    ends = []
+
+    for string in strings:
+        data = string.encode('utf-8')
+        f.write(data)
+        offset += len(data)
+        ends.append(offset)
+
+    return ends, offset
+
+
+def build_index(rows, path: str = DEFAULT_PATH) -> int:
+    """This function builds the CAGE index, streaming the registry so millions of rows never sit in Python objects.
+
+    The names and addresses are stored as UTF-8 blobs with offsets, and the trigram postings as a sparse row matrix,
+    trigram keys with the rows of each key, all memory-mapped when matching.
+
+    :param rows: The iterable of (CAGE code, name, address, ZIP code, country code).
+    :param path: The directory of the index.
+    :return: The number of registered entities.
+    """
+
+    os.makedirs(path, exist_ok=True)
+
+    # The arrays of every chunk
+    cages, counts, zips, countries, name_keys, name_ends, address_ends = [], [], [], [], [], [], []
+
+    # The trigram key and row of every trigram of every name, spilled to disk
+    pairs_path = os.path.join(path, 'pairs.tmp')
+
+    # The number of rows and the sizes of the blobs
+    n, names_size, addresses_size = 0, 0, 0
+
+    with open(os.path.join(path, 'names.bin'), 'wb') as names, \
+            open(os.path.join(path, 'addresses.bin'), 'wb') as addresses, \
+            open(pairs_path, 'wb') as spilled:
+        rows = iter(rows)
+
+        while True:
+            # Read a chunk of rows
+            chunk = [row for _, row in zip(range(CHUNK_ROWS), rows)]
+            if not chunk:
+                break
+
+            # Get the key and trigram keys of each name
+            normalized = [normalize_name(row[1]) for row in chunk]
+            keys = [get_trigram_keys(name) for name in normalized]
+            name_keys.append(np.array([get_name_key(name) for name in normalized], dtype=np.uint32))
+
+            cages.append(np.array([row[0] for row in chunk], dtype='S5'))
+            counts.append(np.array([len(k) for k in keys], dtype=np.uint16))
+            zips.append(np.array([row[3].encode('ascii', 'replace') for row in chunk], dtype='S10'))
+            countries.append(np.array([row[4].encode('ascii', 'replace') for row in chunk], dtype='S3'))
+
+            ends, names_size = _write_strings(names, [row[1] for row in chunk], names_size)
+            name_ends += ends
+            ends, addresses_size = _write_strings(addresses, [row[2] for row in chunk], addresses_size)
+            address_ends += ends
+
+            # Spill the (key, row) pairs of the chunk
+            chunk_pairs = np.empty(sum(len(k) for k in keys), dtype=[('key', np.uint32), ('row', np.uint32)])
+            chunk_pairs['key'] = np.concatenate(keys)
+            chunk_pairs['row'] = np.repeat(np.arange(n, n + len(chunk), dtype=np.uint32), [len(k) for k in keys])
+            chunk_pairs.tofile(spilled)
+
+            n += len(chunk)
+
+    # Save the arrays of every row
+    np.save(os.path.join(path, 'cage.npy'), np.concatenate(cages) if cages else np.empty(0, dtype='S5'))
+    np.save(os.path.join(path, 'trigram_counts.npy'), np.concatenate(counts) if counts else np.empty(0, np.uint16))
+    np.save(os.path.join(path, 'zips.npy'), np.concatenate(zips) if zips else np.empty(0, dtype='S10'))
+    np.save(os.path.join(path, 'countries.npy'), np.concatenate(countries) if countries else np.empty(0, dtype='S3'))
+    np.save(os.path.join(path, 'name_offsets.npy'), np.array([0] + name_ends, dtype=np.uint64))
+    np.save(os.path.join(path, 'address_offsets.npy'), np.array([0] + address_ends, dtype=np.uint64))
+
+    # Sort the rows by name key for the exact matches
+    name_keys = np.concatenate(name_keys) if name_keys else np.empty(0, np.uint32)
+    order = np.argsort(name_keys, kind='stable')
+    np.save(os.path.join(path, 'name_keys.npy'), name_keys[order])
+    np.save(os.path.join(path, 'name_rows.npy'), order.astype(np.uint32))
+
+    # Sort the pairs by trigram key into postings
+    pairs = np.fromfile(pairs_path, dtype=[('key', np.uint32), ('row', np.uint32)])
+    order = np.argsort(pairs['key'], kind='stable')
+    keys, starts = np.unique(pairs['key'][order], return_index=True)
+
+    np.save(os.path.join(path, 'keys.npy'), keys)
+    np.save(os.path.join(path, 'indptr.npy'), np.append(starts, len(order)).astype(np.uint64))
+    np.save(os.path.join(path, 'indices.npy'), pairs['row'][order])
+
+    os.remove(pairs_path)
+
+    return n
+
+
+class CageIndex:
+    """This class matches company names to the entities of a CAGE/SAM registry extract.
+
+    Every array is memory-mapped, so opening the index is instant and only the pages a lookup touches are read,
+    whatever the size of the registry.
+
+    :param path: The directory of the index.
+    :param threshold: The share of trigrams a company and a registered entity must have in common to match.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+
+        # Map arrays
+        self.cage = np.load(os.path.join(path, 'cage.npy'), mmap_mode='r')
+        self.trigram_counts = np.load(os.path.join(path, 'trigram_counts.npy'), mmap_mode='r')
+        self.name_offsets = np.load(os.path.join(path, 'name_offsets.npy'), mmap_mode='r')
+        self.address_offsets = np.load(os.path.join(path, 'address_offsets.npy'), mmap_mode='r')
+        self.zips = np.load(os.path.join(path, 'zips.npy'), mmap_mode='r')
+        self.countries = np.load(os.path.join(path, 'countries.npy'), mmap_mode='r')
+        self.name_keys = np.load(os.path.join(path, 'name_keys.npy'), mmap_mode='r')
+        self.name_rows = np.load(os.path.join(path, 'name_rows.npy'), mmap_mode='r')
+        self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+        self.indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+
+        # Map blobs
+        self.names = np.memmap(os.path.join(path, 'names.bin'), dtype=np.uint8, mode='r') \
+            if self.name_offsets[-1] else np.empty(0, np.uint8)
+        self.addresses = np.memmap(os.path.join(path, 'addresses.bin'), dtype=np.uint8, mode='r') \
+            if self.address_offsets[-1] else np.empty(0, np.uint8)
+
+    @staticmethod
+    def exists(path: str = DEFAULT_PATH) -> bool:
+        """This function checks that an index was built.
+
+        :param path: The directory of the index.
+        :return: If every file of the index exists.
+        """
+
+        return all(os.path.exists(os.path.join(path, name)) for name in FILES)
+
+    def __len__(self) -> int:
+        return len(self.cage)
+
+    def _get_string(self, blob: np.ndarray, offsets: np.ndarray, row: int) -> str:
+        # Decode the string of a row
+        return blob[int(offsets[row]):int(offsets[row + 1])].tobytes().decode('utf-8')
+
+    def _find_exact(self, normalized: str) -> int:
+        # Find the rows with the key of the name, the keys can collide so the names are compared
+        key = get_name_key(normalized)
+        start, end = np.searchsorted(self.name_keys, [key, key + 1])
+
+        for row in self.name_rows[start:end]:
+            if normalize_name(self._get_string(self.names, self.name_offsets, int(row))) == normalized:
+                return int(row)
+
+        return None
+
+    def _find_similar(self, normalized: str) -> (int, float):
+        # Get trigram keys
+        query = get_trigram_keys(normalized)
+        if not len(query) or not len(self.keys):
+            return None, 0.0
+
+        # Find the postings of each trigram of the registry, the unknown trigrams have none
+        positions = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        found = self.keys[positions] == query
+        starts = np.where(found, self.indptr[positions], 0).astype(np.int64)
+        ends = np.where(found, self.indptr[positions + 1], 0).astype(np.int64)
+
+        # An entity sharing the threshold of the trigrams misses at most this many, so it has one of the rarest
+        # trigrams past them, and only their postings give candidates however common the other trigrams are
+        needed = int(np.ceil(self.threshold * len(query)))
+        order = np.argsort(ends - starts, kind='stable')
+        prefix, rest = order[:len(query) - needed + 1], order[len(query) - needed + 1:]
+
+        postings = [self.indices[starts[p]:ends[p]] for p in prefix if ends[p] > starts[p]]
+        if not postings:
+            return None, 0.0
+
+        # Count the trigrams each candidate shares with the name in the rarest trigrams
+        rows, shared = np.unique(np.concatenate(postings), return_counts=True)
+
+        # Add the common trigrams, the rows of each posting are sorted so membership is a binary search
+        for p in rest:
+            if ends[p] > starts[p]:
+                posting = self.indices[starts[p]:ends[p]]
+                at = np.minimum(np.searchsorted(posting, rows), len(posting) - 1)
+                shared += posting[at] == rows
+
+        # Jaccard similarity of the full trigram sets
+        scores = shared / (len(query) + self.trigram_counts[rows].astype(np.int64) - shared)
+        best = int(np.argmax(scores))
+
+        return int(rows[best]), float(scores[best])
+
+    def match_one(self, name: str) -> dict:
+        """This function matches a company name to the registered entity with the same normalized name, or else the one
+        sharing the largest share of its trigrams.
+
+        :param name: The company name.
+        :return: The CAGE code, confidence, address, ZIP code, country code and registered name, or None if no entity
+            matches.
+        """
+
+        # Get normalized name
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+
+        # Exact match
+        row, score = self._find_exact(normalized), 1.0
+
+        # Closest match
+        if row is None:
+            row, score = self._find_similar(normalized)
+
+        if row is None or score < self.threshold:
+            return None
+
+        return {
+            'CAGE': self.cage[row].decode('ascii'),
+            'Confidence': score,
+            'Address': self._get_string(self.addresses, self.address_offsets, row),
+            'ZIP': self.zips[row].decode('ascii'),
+            'Country': self.countries[row].decode('ascii'),
+            'Registered Name': self._get_string(self.names, self.name_offsets, row)
+        }
+
+    def match(self, names) -> dict:
+        """This function matches many company names, such as every company of a prediction.
+
+        :param names: The iterable of company names.
+        :return: The match of each name, None if no entity matches.
+        """
+
+        return {name: self.match_one(name) for name in dict.fromkeys(names)}
+
+
+def main():
+    # Command line arguments
+    parser = argparse.ArgumentParser(description='Build the CAGE index from a CAGE/SAM registry extract.')
+    parser.add_argument('input', help='The CSV file of the extract, with a header.')
+    parser.add_argument('--output', default=DEFAULT_PATH, help='The directory of the index.')
+    parser.add_argument('--delimiter', default=',', help="The delimiter, '|' for the SAM public extract.")
+    parser.add_argument('--cage-column', default=DEFAULT_CAGE_COLUMN, help='The column of the CAGE code.')
+    parser.add_argument('--name-column', default=DEFAULT_NAME_COLUMN, help='The column of the legal business name.')
+    parser.add_argument('--address-columns', nargs='+', default=DEFAULT_ADDRESS_COLUMNS,
+                        help='The columns joined into the address.')
+    parser.add_argument('--zip-column', default=DEFAULT_ZIP_COLUMN, help='The column of the ZIP code.')
+    parser.add_argument('--country-column', default=DEFAULT_COUNTRY_COLUMN, help='The column of the country code.')
+    args = parser.parse_args()
+
+    # Build index
+    n = build_index(
+        rows=read_registry(
+            path=args.input,
+            cage_column=args.cage_column,
+            name_column=args.name_column,
+            address_columns=args.address_columns,
+            zip_column=args.zip_column,
+            country_column=args.country_column,
+            delimiter=args.delimiter
+        ),
+        path=args.output
+    )
+
+    print(f'{n} entities indexed in {args.output}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import io
+import json
+import numpy as np
+import scipy.sparse
+from itertools import combinations
+
+# The number of distinct companies kept, the companies found after are left out of the matrix
+DEFAULT_MAX_VOCABULARY = 50000
+
+# The number of companies of one article paired, the most mentioned first, since pairs grow with their square
+MAX_ARTICLE_COMPANIES = 50
+
+# The number of pairs buffered before they are added to the matrix
+BUFFER_PAIRS = 1000000
+
+# The number of neighbors of a company returned
+DEFAULT_NEIGHBORS = 10
+
+
+class CooccurrenceMatrix:
+    """This class counts the articles in which each pair of companies appears together, in a sparse matrix.
+
+    Pairs are buffered in arrays and summed into a CSR matrix of the upper triangle, so memory stays bounded by the
+    number of distinct pairs, and the vocabulary is capped so tens of thousands of companies fit.
+
+    :param max_vocabulary: The number of distinct companies kept.
+    """
+
+    def __init__(self, max_vocabulary: int = DEFAULT_MAX_VOCABULARY):
+        self.max_vocabulary = max_vocabulary
+
+        # The id of each company, and the company of each id
+        self._ids = {}
+        self.names = []
+
+        # The pairs not yet added to the matrix
+        self._rows = []
+        self._cols = []
+        self._buffered = 0
+
+        # The number of articles of each pair, upper triangle only
+        self._matrix = scipy.sparse.csr_matrix((max_vocabulary, max_vocabulary), dtype=np.int32)
+
+        # The number of articles added and the companies left out
+        self.articles = 0
+        self.dropped = 0
+
+    def _get_id(self, name: str) -> int:
+        # Get the id of a company, None once the vocabulary is full
+        i = self._ids.get(name)
+
+        if i is None and len(self.names) < self.max_vocabulary:
+            i = self._ids[name] = len(self.names)
+            self.names.append(name)
+        elif i is None:
+            self.dropped += 1
+
+        return i
+
+    def add(self, companies: dict) -> None:
+        """This function adds the companies found together in one article.
+
+        :param companies: The companies of the article stored in a dictionary with counts.
+        """
+
+        self.articles += 1
+
+        # The most mentioned companies of the article
+        names = sorted(companies, key=lambda name: -companies[name]['Count'])[:MAX_ARTICLE_COMPANIES]
+
+        # Get ids
+        ids = sorted({i for i in map(self._get_id, names) if i is not None})
+        if len(ids) < 2:
+            return
+
+        # Buffer every pair of the article
+        rows, cols = zip(*combinations(ids, 2))
+        self._rows.append(np.array(rows, dtype=np.int32))
+        self._cols.append(np.array(cols, dtype=np.int32))
+        self._buffered += len(rows)
+
+        if self._buffered >= BUFFER_PAIRS:
+            self._flush()
+
+    def _flush(self) -> None:
+        # Sum the buffered pairs into the matrix
+        if not self._buffered:
+            return
+
+        rows, cols = np.concatenate(self._rows), np.concatenate(self._cols)
+        self._matrix = self._matrix + scipy.sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=self._matrix.shape
+        )
+
+        self._rows, self._cols, self._buffered = [], [], 0
+
+    @property
+    def matrix(self) -> scipy.sparse.csr_matrix:
+        """The symmetric co-occurrence matrix of the companies in the vocabulary."""
+
+        self._flush()
+
+        # Mirror the upper triangle
+        n = len(self.names)
+        upper = self._matrix[:n, :n]
+
+        return (upper + upper.T).tocsr()
+
+    def merge(self, other: 'CooccurrenceMatrix') -> 'CooccurrenceMatrix':
+        """This function adds the pairs of another matrix, such as the one of another date.
+
+        :param other: The other co-occurrence matrix.
+        :return: This matrix.
+        """
+
+        other._flush()
+
+        # Map the ids of the other vocabulary to this one, leaving out the companies that don't fit
+        mapping = np.array([-1 if (i := self._get_id(name)) is None else i for name in other.names], dtype=np.int64)
+        coo = other._matrix[:len(other.names), :len(other.names)].tocoo()
+        rows, cols = mapping[coo.row], mapping[coo.col]
+        kept = (rows >= 0) & (cols >= 0)
+
+        # Keep pairs in the upper triangle
+        rows, cols = rows[kept], cols[kept]
+        self._matrix = self._matrix + scipy.sparse.csr_matrix(
+            (coo.data[kept], (np.minimum(rows, cols), np.maximum(rows, cols))),
+            shape=self._matrix.shape
+        )
+
+        self.articles += other.articles
+        self.dropped += other.dropped
+
+        return self
+
+    def top_neighbors(self, name: str, k: int = DEFAULT_NEIGHBORS) -> list:
+        """This function gets the companies found the most often in the same articles as a company.
+
+        :param name: The company.
+        :param k: The number of neighbors.
+        :return: The neighbors with the number of articles they share, most shared first.
+        """
+
+        i = self._ids.get(name)
+        if i is None:
+            return []
+
+        # The row and column of the company, since only the upper triangle is stored
+        self._flush()
+        row = self._matrix.getrow(i)
+        col = self._matrix.getcol(i).tocsc()
+        ids = np.concatenate([row.indices, col.indices])
+        counts = np.concatenate([row.data, col.data])
+
+        # The k largest counts
+        top = np.argsort(-counts, kind='stable')[:k]
+
+        return [{'Name': self.names[ids[j]], 'Articles': int(counts[j])} for j in top]
+
+    def to_bytes(self) -> bytes:
+        """This function serializes the matrix and its vocabulary, to be stored with the prediction.
+
+        :return: The compressed NumPy archive of the matrix and vocabulary.
+        """
+
+        self._flush()
+
+        matrix = self._matrix[:len(self.names), :len(self.names)].tocsr()
+        state = json.dumps({'names': self.names, 'articles': self.articles, 'dropped': self.dropped})
+
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            state=np.frombuffer(state.encode('utf-8'), dtype=np.uint8)
+        )
+
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_vocabulary: int = DEFAULT_MAX_VOCABULARY) -> 'CooccurrenceMatrix':
+        """This function loads a serialized matrix.
+
+        :param data: The compressed NumPy archive of the matrix and vocabulary.
+        :param max_vocabulary: The number of distinct companies kept.
+        :return: The co-occurrence matrix.
+        """
+
+        matrix = cls(max_vocabulary=max_vocabulary)
+
+        with np.load(io.BytesIO(data)) as archive:
+            state = json.loads(archive['state'].tobytes().decode('utf-8'))
+            n = len(state['names'])
+
+            # The saved vocabulary may be larger than this one, so it is merged into an empty matrix
+            other = cls(max_vocabulary=n)
+            other.names = state['names']
+            other._ids = {name: i for i, name in enumerate(other.names)}
+            other._matrix = scipy.sparse.csr_matrix(
+                (archive['data'], archive['indices'], archive['indptr']),
+                shape=(n, n)
+            )
+            other.articles, other.dropped = state['articles'], state['dropped']
+
+        return matrix.merge(other)
@@ -0,0 +1,183 @@
+import re
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from metrics import metrics
+
+# The number of bits of a fingerprint
+FINGERPRINT_BITS = 64
+
+# The number of differing bits up to which two articles are copies of the same story
+DEFAULT_MAX_DISTANCE = 4
+
+# The bits of the per-bit weight sums packed in one integer
+FIELD_BITS = 32
+
+# The words of a title or summary
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def get_features(text: str) -> Counter:
+    """This function gets the words of a text with their counts, titles and summaries are too short for word pairs.
+
+    :param text: The text.
+    :return: The features with their counts.
+    """
+
+    return Counter(WORD_PATTERN.findall(text.lower()))
+
+
+@lru_cache(maxsize=2 ** 16)
+def hash_feature(feature: str) -> int:
+    """This function hashes a feature the same way in every process, with each bit in its own 32 bit field.
+
+    Adding the spread hashes of every feature sums the weights of each bit at once, common words are only spread once.
+
+    :param feature: The feature.
+    :return: The 64 bit hash, spread over 64 fields.
+    """
+
+    # Get hash
+    h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    return sum(1 << (bit * FIELD_BITS) for bit in range(FINGERPRINT_BITS) if h >> bit & 1)
+
+
+def simhash(text: str) -> int:
+    """This function gets the SimHash fingerprint of a text, similar texts get fingerprints differing in few bits.
+
+    :param text: The text.
+    :return: The 64 bit fingerprint, or None if the text has no words.
+    """
+
+    # Get features
+    features = get_features(text)
+    if not features:
+        return None
+
+    # The total weight of every feature, and the weight of the features setting each bit
+    total = sum(features.values())
+    sums = sum(weight * hash_feature(feature) for feature, weight in features.items())
+
+    # Set each bit the features mostly agree on
+    mask = (1 << FIELD_BITS) - 1
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if 2 * (sums >> (bit * FIELD_BITS) & mask) > total:
+            fingerprint |= 1 << bit
+
+    return fingerprint
+
+
+def get_article_fingerprint_text(article: dict) -> str:
+    """This function gets the text an article is fingerprinted by, its title and summary from newscatcherapi.
+
+    :param article: The article.
+    :return: The title and summary.
+    """
+
+    return f'{article.get("title") or ""} {article.get("summary") or ""}'
+
+
+class NearDuplicateIndex:
+    """This class groups articles whose title and summary differ in a few words, such as wire-service reprints.
+
+    Fingerprints are split into max_distance + 1 bands, two fingerprints within max_distance bits share at least one
+    band, so each article is only compared with the articles sharing a band with it.
+
+    :param max_distance: The number of differing bits up to which two articles are copies of the same story.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+
+        # The first article of each story with its fingerprint, keyed by band
+        self._buckets = {}
+
+        # The copies of each story, keyed by its first article
+        self.clusters = {}
+
+        # The first article of the story of every article added
+        self._representatives = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._representatives
+
+    def _get_bands(self, fingerprint: int) -> list:
+        # The last band takes the remaining bits
+        mask = (1 << self.band_bits) - 1
+        bands = [(i, fingerprint >> (i * self.band_bits) & mask) for i in range(self.bands - 1)]
+        bands.append((self.bands - 1, fingerprint >> ((self.bands - 1) * self.band_bits)))
+
+        return bands
+
+    def add(self, key: str, text: str) -> str:
+        """This function adds an article to the index.
+
+        :param key: The article link.
+        :param text: The text the article is fingerprinted by.
+        :return: The link of the first article of the same story, the article's own link if it is a new story.
+        """
+
+        # An article found twice belongs to the same story
+        if key in self._representatives:
+            return self._representatives[key]
+
+        # Get fingerprint, an article without words is always a new story
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            self.clusters[key] = []
+            self._representatives[key] = key
+            return key
+
+        bands = self._get_bands(fingerprint)
+
+        # Compare with the stories sharing a band
+        for band in bands:
+            for representative, other in self._buckets.get(band, ()):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    self.clusters[representative].append(key)
+                    self._representatives[key] = representative
+                    return representative
+
+        # A new story
+        for band in bands:
+            self._buckets.setdefault(band, []).append((key, fingerprint))
+        self.clusters[key] = []
+        self._representatives[key] = key
+
+        return key
+
+    def multiplicity(self, key: str) -> int:
+        """This function gets the number of copies of a story.
+
+        :param key: The link of the first article of the story.
+        :return: The number of articles of the story.
+        """
+
+        return len(self.clusters.get(key, ())) + 1
+
+
+def deduplicate(articles, index: NearDuplicateIndex):
+    """This function skips the articles that are copies of an earlier article, before any of them is downloaded.
+
+    :param articles: The iterable of articles with their link, title and summary.
+    :param index: The index of the stories seen so far.
+    :return: A generator of the first article of each story.
+    """
+
+    for article in articles:
+        # Skip an article found twice
+        if article['link'] in index:
+            metrics.add('deduplicate', skipped=1)
+            continue
+
+        # Get the first article of the same story
+        representative = index.add(article['link'], get_article_fingerprint_text(article))
+
+        if representative == article['link']:
+            yield article
+        else:
+            metrics.add('deduplicate', skipped=1)
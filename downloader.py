@@ -0,0 +1,235 @@
+import requests
+import contextvars
+from threading import BoundedSemaphore, Lock, local
+from urllib.parse import urlsplit
+from metrics import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# The number of articles downloaded at the same time
+DEFAULT_WORKERS = 16
+
+# The number of articles downloaded at the same time from one host
+DEFAULT_PER_HOST = 4
+
+# The seconds to wait for a host to connect and respond
+DEFAULT_TIMEOUT = 10
+
+# The number of times a failed download is retried
+DEFAULT_RETRIES = 2
+
+# The browser user agent, some news sites refuse the default requests one
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+             'Chrome/103.0.0.0 Safari/537.36'
+
+# The HTTP session of each download thread
+_sessions = local()
+
+# The semaphores limiting downloads per host
+_host_semaphores = {}
+
+# The lock guarding the host semaphores
+_host_semaphores_lock = Lock()
+
+
+def get_session(retries: int = DEFAULT_RETRIES, pool_size: int = DEFAULT_PER_HOST) -> requests.Session:
+    """This function gets the pooled HTTP session of the current thread.
+
+    :param retries: The number of times a failed request is retried.
+    :param pool_size: The number of connections kept open per host.
+    :return: The session.
+    """
+
+    # Create the session the first time this thread downloads
+    if getattr(_sessions, 'session', None) is None:
+        # Retry connection errors and busy servers with backoff
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',)
+        )
+
+        # Keep connections open between requests
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        _sessions.session = session
+
+    return _sessions.session
+
+
+def get_host_semaphore(url: str, max_per_host: int = DEFAULT_PER_HOST) -> BoundedSemaphore:
+    """This function gets the semaphore limiting concurrent downloads from the url's host.
+
+    :param url: The article url.
+    :param max_per_host: The number of downloads allowed at the same time from one host.
+    :return: The semaphore.
+    """
+
+    # Get host
+    host = urlsplit(url).netloc.lower()
+
+    with _host_semaphores_lock:
+        return _host_semaphores.setdefault(host, BoundedSemaphore(max_per_host))
+
+
+def fetch_html(url: str, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+               max_per_host: int = DEFAULT_PER_HOST) -> str:
+    """This function downloads the article html.
+
+    :param url: The article url.
+    :param timeout: The seconds to wait for the host.
+    :param retries: The number of times a failed download is retried.
+    :param max_per_host: The number of downloads allowed at the same time from one host.
+    :return: The article html.
+    """
+
+    # Get session
+    session = get_session(retries=retries, pool_size=max_per_host)
+
+    # Download article, never more than max_per_host from the same host
+    with get_host_semaphore(url, max_per_host=max_per_host):
+        response = session.get(url, timeout=timeout)
+
+    # Raise on 4xx and 5xx responses
+    response.raise_for_status()
+
+    # Count the bytes downloaded
+    metrics.add('get_article_text', bytes=len(response.content))
+
+    return response.text
+
+
+def parse_article_text(url: str, html: str) -> str:
+    """This function extracts the article text from the html.
+
+    :param url: The article url.
+    :param html: The article html.
+    :return: The article text.
+    """
+
+    # Imported on the first download, so the app starts without loading newspaper
+    from newspaper import Article
+
+    # Get article
+    article = Article(url)
+
+    # Use the html that was already downloaded
+    article.download(input_html=html)
+
+    # Parse article
+    article.parse()
+
+    return article.text
+
+
+def clean_text(text: str) -> str:
+    """This function replaces line breaks, tabs and non-breaking spaces with spaces.
+
+    :param text: The article text.
+    :return: The clean text.
+    """
+
+    # Clean text
+    text = text.replace('\n', ' ')
+    text = text.replace('\t', ' ')
+    text = text.replace('\r', ' ')
+    text = text.replace('\xa0', ' ')
+
+    return text
+
+
+def _download_article_text(url: str, timeout: float, retries: int, max_per_host: int) -> str:
+    """This function downloads, parses and cleans one article, in a download thread.
+
+    :param url: The article url.
+    :param timeout: The seconds to wait for the host.
+    :param retries: The number of times a failed download is retried.
+    :param max_per_host: The number of downloads allowed at the same time from one host.
+    :return: The clean article text.
+    """
+
+    # Download article
+    html = fetch_html(url, timeout=timeout, retries=retries, max_per_host=max_per_host)
+
+    # Parse article as soon as it arrives
+    text = parse_article_text(url, html)
+
+    return clean_text(text)
+
+
+def get_article_texts(urls, cache=None, max_workers: int = DEFAULT_WORKERS, max_per_host: int = DEFAULT_PER_HOST,
+                      timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+    """This function downloads many articles concurrently, reading the article text cache first.
+
+    :param urls: The iterable of article urls.
+    :param cache: The article text cache, or None to always download.
+    :param max_workers: The number of articles downloaded at the same time.
+    :param max_per_host: The number of articles downloaded at the same time from one host.
+    :param timeout: The seconds to wait for a host.
+    :param retries: The number of times a failed download is retried.
+    :return: A generator of (url, text) in the order downloads finish, text is None if the download failed.
+    """
+
+    # The error of articles newspaper fails to download or parse
+    from newspaper.article import ArticleException
+
+    # Get urls
+    urls = iter(urls)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # The downloads in progress, keyed by future
+        futures = {}
+
+        while True:
+            # Keep at most two downloads per worker queued
+            for url in urls:
+                # Skip the download if the article text was already extracted
+                if cache is not None:
+                    text = cache.get(url)
+
+                    if text is not None:
+                        metrics.add('get_article_text', cache_hits=1)
+                        yield url, text
+                        continue
+
+                    metrics.add('get_article_text', cache_misses=1)
+
+                # Count the download in the metrics scope of the caller
+                future = executor.submit(
+                    contextvars.copy_context().run, _download_article_text, url, timeout, retries, max_per_host
+                )
+                futures[future] = url
+
+                if len(futures) >= 2 * max_workers:
+                    break
+
+            # Stop when every url was downloaded
+            if not futures:
+                break
+
+            # Hand over each article as soon as it is done
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                url = futures.pop(future)
+
+                try:
+                    text = future.result()
+                except (requests.RequestException, ArticleException) as e:
+                    # Record the failure instead of losing it
+                    metrics.failed('get_article_text', e)
+                    yield url, None
+                    continue
+
+                # Store article text so it is never downloaded again
+                if cache is not None:
+                    cache.put(url, text)
+
+                yield url, text
@@ -0,0 +1,84 @@
+import io
+import gzip
+import hashlib
+import pandas as pd
+
+# The file extension and MIME type of each export format
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Compressed CSV': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Arrow': ('arrow', 'application/vnd.apache.arrow.file')
+}
+
+# The export format selected by default
+DEFAULT_FORMAT = 'CSV'
+
+# The gzip level of compressed CSV, higher levels are much slower for little gain on text
+COMPRESSION_LEVEL = 6
+
+
+def get_version(df: pd.DataFrame) -> str:
+    """This function gets the content version of a dataframe, the same for the same rows in the same order.
+
+    Hashing the rows is vectorized and much faster than serializing them, so it decides whether an export is cached.
+
+    :param df: The dataframe.
+    :return: The hexadecimal digest of the columns and rows.
+    """
+
+    # Hash columns and rows
+    digest = hashlib.sha1(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+    return digest.hexdigest()
+
+
+def serialize(df: pd.DataFrame, export_format: str = DEFAULT_FORMAT) -> bytes:
+    """This function serializes a dataframe in an export format.
+
+    :param df: The dataframe.
+    :param export_format: The export format, a key of FORMATS.
+    :return: The file contents.
+    """
+
+    if export_format == 'CSV':
+        return df.to_csv().encode('utf-8')
+
+    if export_format == 'Compressed CSV':
+        # No timestamp, so the same rows always give the same bytes
+        return gzip.compress(df.to_csv().encode('utf-8'), compresslevel=COMPRESSION_LEVEL, mtime=0)
+
+    # The columnar formats, written by pyarrow
+    buffer = io.BytesIO()
+
+    if export_format == 'Parquet':
+        df.to_parquet(buffer, index=False)
+    elif export_format == 'Arrow':
+        # Feather version 2 is the Arrow IPC file format, which needs a default index
+        df.reset_index(drop=True).to_feather(buffer)
+    else:
+        raise ValueError(f'Unknown export format {export_format!r}, expected one of {", ".join(FORMATS)}.')
+
+    return buffer.getvalue()
+
+
+def get_file_name(name: str, export_format: str = DEFAULT_FORMAT) -> str:
+    """This function gets the file name of an export.
+
+    :param name: The file name without extension.
+    :param export_format: The export format, a key of FORMATS.
+    :return: The file name with the extension of the format.
+    """
+
+    return f'{name}.{FORMATS[export_format][0]}'
+
+
+def get_mime_type(export_format: str = DEFAULT_FORMAT) -> str:
+    """This function gets the MIME type of an export.
+
+    :param export_format: The export format, a key of FORMATS.
+    :return: The MIME type.
+    """
+
+    return FORMATS[export_format][1]
@@ -0,0 +1,118 @@
+import time
+import traceback
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+# The number of jobs running at the same time
+DEFAULT_WORKERS = 2
+
+# The seconds a finished job is remembered, so pages polling it see its result
+JOB_TTL = 600
+
+
+class Job:
+    """This class is the status and progress of a background job.
+
+    :param key: The key of the job, jobs with the same key are computed once.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.status = 'pending'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        """If the job finished, successfully or not."""
+
+        return self.status in ('done', 'failed')
+
+    def update(self, **progress) -> None:
+        """This function records the progress of the job.
+
+        :param progress: The progress values, such as the number of articles processed.
+        """
+
+        self.progress = {**self.progress, **progress}
+
+
+class JobRunner:
+    """This class runs jobs on a worker pool in the background, computing each key only once at a time.
+
+    :param max_workers: The number of jobs running at the same time.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = Lock()
+
+    def submit(self, key: str, fn, *args, retry: bool = False, **kwargs) -> Job:
+        """This function starts a job, unless a job with the same key is pending, running or recently finished.
+
+        A failed job is kept until it is retried explicitly or forgotten, so pages polling it show its error instead
+        of starting it again on every poll.
+        The job function gets the job as its 'job' keyword argument so it can report progress.
+
+        :param key: The key of the job.
+        :param fn: The job function.
+        :param retry: If a failed job with the same key is started again.
+        :param args: The arguments of the job function.
+        :param kwargs: The keyword arguments of the job function.
+        :return: The job.
+        """
+
+        with self._lock:
+            # Forget the jobs that finished long ago
+            now = time.time()
+            for k in [k for k, v in self._jobs.items() if v.finished is not None and now - v.finished > JOB_TTL]:
+                del self._jobs[k]
+
+            # Share the job in flight, or its result, a failed job is only started again when retried
+            job = self._jobs.get(key)
+            if job is not None and not (retry and job.status == 'failed'):
+                return job
+
+            job = Job(key=key)
+            self._jobs[key] = job
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+
+        return job
+
+    def get(self, key: str) -> Job:
+        """This function gets a job.
+
+        :param key: The key of the job.
+        :return: The job, or None if there isn't any.
+        """
+
+        with self._lock:
+            return self._jobs.get(key)
+
+    def jobs(self) -> list:
+        """This function gets every job that is remembered.
+
+        :return: The jobs.
+        """
+
+        with self._lock:
+            return list(self._jobs.values())
+
+    @staticmethod
+    def _run(job: Job, fn, args: tuple, kwargs: dict) -> None:
+        # Run job
+        job.status = 'running'
+
+        try:
+            job.result = fn(*args, job=job, **kwargs)
+            job.status = 'done'
+        except Exception:
+            job.error = traceback.format_exc()
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
@@ -1,6 +1,11 @@
+import time
 import pandas as pd
 
 from utils import *
+from pipeline import submit_prediction, get_prediction_job
+from metrics import to_json, to_prometheus
+from ner import get_model_stats
+from exports import get_version, get_file_name, get_mime_type, FORMATS
 from st_aggrid import AgGrid
 from st_aggrid.grid_options_builder import GridOptionsBuilder
 from st_aggrid.shared import GridUpdateMode, DataReturnMode
@@ -20,10 +25,17 @@ def main():
         st.session_state['articles_count'] = None
     if 'date' not in st.session_state:
         st.session_state['date'] = None
+    if 'companies_count' not in st.session_state:
+        st.session_state['companies_count'] = None
+    if 'metrics' not in st.session_state:
+        st.session_state['metrics'] = None
 
     # Set sidebar
     st.session_state['technology'], select_date = set_sidebar()
 
+    # Sidebar checkbox to show where the last prediction spent its time
+    show_timing = st.sidebar.checkbox(label='Show timing panel')
+
     if st.session_state['technology'] == '-':
         # Print title
         st.title(
@@ -77,9 +89,17 @@ def main():
         technology_string = technology_string.replace(' ', '_')
 
         # The collection name
-        collection_name = f'{date_string}_{technology_string}'
+        collection_name = get_collection_name(date=select_date, technology=st.session_state['technology'])
+
+        # The counters of every stage of this session before this run
+        run_metrics = metrics.current_scope()
+        run_start = run_metrics.snapshot()
+
+        # If the technology or date changed since the last run
+        refreshed = st.session_state['df_tech'] != st.session_state['technology'] or \
+            st.session_state['date'] != date_string
 
-        if st.session_state['df_tech'] != st.session_state['technology'] or st.session_state['date'] != date_string:
+        if refreshed:
             # Clear page
             st.empty()
             st.empty()
@@ -87,72 +107,120 @@ def main():
             st.empty()
             st.empty()
 
-            # Get articles from mongoDB collection
-            articles = get_collection(collection_name=collection_name)
-
-            # Get articles count
-            st.session_state['articles_count'] = count_documents(collection_name=collection_name)
-
-            # If there wasn't any previous articles in the database, use newscatcherapi and store in mongoDB Atlas
-            # database
-            if f'{collection_name}' not in db.list_collection_names():
-                # Get articles
-                articles, st.session_state['articles_count'] = consume_api(
+            # If there wasn't a previous prediction, calculate new prediction in the background
+            if not prediction_completed(date=select_date, technology=st.session_state['technology']):
+                # Get company names using Name Entity Recognition, sessions asking for the same prediction share the job
+                job = submit_prediction(
                     date=select_date,
                     technology=st.session_state['technology']
                 )
 
-            # If there wasn't a previous prediction, calculate new prediction
-            if f'{collection_name}_prediction' not in db.list_collection_names():
-                with st.spinner('Please wait...'):
-                    # Get company names using Name Entity Recognition and perform Sentiment Analysis on article text
-                    companies = natural_language_processing(articles=articles)
+                # Display the error of a failed job, it is only computed again when the user asks
+                if job.status == 'failed':
+                    st.error('The prediction failed.')
+                    st.code(job.error)
 
-                # Convert dictionary to list
-                companies_list = dictionary_to_list(companies)
+                    if st.button(label='Retry'):
+                        submit_prediction(date=select_date, technology=st.session_state['technology'], retry=True)
+                        st.experimental_rerun()
 
-                # Store companies in the database
-                store_documents(
-                    documents=companies_list,
-                    collection_name=f'{collection_name}_prediction'
-                )
+                    st.stop()
 
-                # Convert dictionary to pandas dataframe
-                df = pd.concat({k: pd.DataFrame.from_dict(v, 'index') for k, v in companies.items()},
-                               axis=0).reset_index()
+                # Display progress and poll the job until it is done
+                if not job.done:
+                    st.info(
+                        f'Computing prediction... processed {job.progress.get("articles_processed", 0)} articles, '
+                        f'found {job.progress.get("companies_found", 0)} companies.'
+                    )
 
-                # Drop empty columns
-                df.drop(
-                    columns=['level_1'],
-                    inplace=True
-                )
+                    # Display the companies found so far
+                    if job.progress.get('top_companies'):
+                        st.dataframe(pd.DataFrame(job.progress['top_companies'], columns=['Name', 'Count']))
 
-                # Rename columns
-                df.columns = ['Name', 'Count']
-            else:
-                # Check if there was a previous prediction
-                companies = get_collection(collection_name=f'{collection_name}_prediction')
-
-                # Convert cursor to dataframe
-                df = pd.DataFrame(list(companies))
-
-            # Sort dataframe by count
-            if not df.empty:
-                df.sort_values(
-                    by='Count',
-                    ascending=False,
-                    inplace=True
-                )
+                    time.sleep(1)
+                    st.experimental_rerun()
+
+            # Get articles count
+            st.session_state['articles_count'] = count_documents(collection_name=collection_name)
+
+            # Get companies count
+            st.session_state['companies_count'] = count_documents(collection_name=f'{collection_name}_prediction')
 
             # Set session state
             st.session_state['df_tech'] = st.session_state['technology']
-            st.session_state['df'] = df
             st.session_state['date'] = date_string
 
+        # Set 2 columns for the ranking options
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Number of companies to display
+            top_n = st.number_input(
+                label='Number of companies:',
+                min_value=1,
+                value=TOP_COMPANIES,
+                step=100
+            )
+        with col2:
+            # Minimum count of a company
+            min_count = st.number_input(
+                label='Minimum count:',
+                min_value=1,
+                value=1
+            )
+
+        with metrics.timer('dataframe'):
+            # Get the top companies sorted by count from mongoDB Atlas database
+            st.session_state['df'] = pd.DataFrame(
+                get_top_companies(
+                    technology=st.session_state['technology'],
+                    dates=(select_date,),
+                    top_n=int(top_n),
+                    min_count=int(min_count)
+                ),
+                columns=['Name', 'Count', 'Sentiment', 'SentimentVariance']
+            )
+
+            metrics.add('dataframe', items=len(st.session_state['df']))
+
+        # Match every company to its CAGE code and address, once the CAGE index was built with cage.py
+        if get_cage_index() is not None:
+            st.session_state['df'] = pd.concat([
+                st.session_state['df'],
+                pd.DataFrame(match_cage(tuple(st.session_state['df']['Name'])), index=st.session_state['df'].index)
+            ], axis=1)
+
+            # Find the DoD installations near the ZIP code of every company in the United States
+            if get_installation_index() is not None and get_zip_geocoder() is not None:
+                # The radius of the installations near a company
+                radius = st.number_input(
+                    label='Installation radius (miles):',
+                    min_value=1.0,
+                    value=INSTALLATION_RADIUS
+                )
+
+                st.session_state['df'] = pd.concat([
+                    st.session_state['df'],
+                    pd.DataFrame(
+                        match_installations(
+                            zips=tuple(st.session_state['df']['ZIP']),
+                            countries=tuple(st.session_state['df']['Country']),
+                            radius=float(radius)
+                        ),
+                        index=st.session_state['df'].index
+                    )
+                ], axis=1)
+
+        # Keep the counters of the run that fetched the prediction, with the background job that computed it
+        if refreshed:
+            job = get_prediction_job(date=select_date, technology=st.session_state['technology'])
+            job_metrics = job.progress.get('metrics', {}) if job is not None else {}
+            st.session_state['metrics'] = {**job_metrics, **run_metrics.diff(run_start)}
+
         # Display statistics
         st.write(
             f'There are {st.session_state["articles_count"]} articles on {st.session_state["technology"]} on {select_date.strftime("%Y/%m/%d")}.\n'
-            f'Found {len(st.session_state["df"])} companies total.')
+            f'Found {st.session_state["companies_count"]} companies total.')
 
         # Grid options
         gb = GridOptionsBuilder.from_dataframe(st.session_state['df'])
@@ -169,6 +237,10 @@ def main():
             aggFunc='sum',
             editable=True
         )
+
+        # Filter the companies by their distance to the nearest installation
+        if 'Distance' in st.session_state['df']:
+            gb.configure_column('Distance', type=['numericColumn'], filter='agNumberColumnFilter', precision=1)
         gridOptions = gb.build()
 
         # Display dataframe
@@ -183,26 +255,148 @@ def main():
         # Convert selected rows as dataframe
         st.session_state['selected_df'] = pd.DataFrame(selected_data['selected_rows'])
 
+        # Export format
+        export_format = st.selectbox(label='Export format:', options=list(FORMATS))
+
         # Set 2 columns for the options.
         col1, col2 = st.columns(2)
 
         with col1:
-            # Save all raw data button to save DataFrame as CSV file.
+            # Save all raw data button, serialized once per content version however many reruns there are.
             st.download_button(
                 label='Download All Data',
-                data=st.session_state['df'].to_csv(),
-                file_name=f'{date_string}_{technology_string}.csv',
-                mime='text/csv'
+                data=export_dataframe(
+                    st.session_state['df'],
+                    version=get_version(st.session_state['df']),
+                    export_format=export_format
+                ),
+                file_name=get_file_name(f'{date_string}_{technology_string}', export_format=export_format),
+                mime=get_mime_type(export_format=export_format)
             )
         with col2:
-            # Save selected raw data button to save DataFrame as CSV file.
+            # Save selected raw data button, serialized once per selection.
             st.download_button(
                 label='Download Selected Data',
-                data=st.session_state['selected_df'].to_csv(),
-                file_name=f'{date_string}_{technology_string}.csv',
-                mime='text/csv'
+                data=export_dataframe(
+                    st.session_state['selected_df'],
+                    version=get_version(st.session_state['selected_df']),
+                    export_format=export_format
+                ),
+                file_name=get_file_name(f'{date_string}_{technology_string}', export_format=export_format),
+                mime=get_mime_type(export_format=export_format)
+            )
+
+        # Export every company of several dates from the database
+        with st.expander(label='Bulk export'):
+            date_range = st.date_input(
+                label='Dates:',
+                value=(select_date - timedelta(days=6), select_date),
+                max_value=select_date
             )
 
+            # Wait for both ends of the range, and for the export to be asked for since it reads every date
+            if len(date_range) == 2 and st.checkbox(label='Prepare bulk export'):
+                start, end = date_range
+                dates = tuple(start + timedelta(days=i) for i in range((end - start).days + 1))
+
+                st.download_button(
+                    label=f'Download {len(dates)} Days',
+                    data=export_predictions(
+                        technology=st.session_state['technology'],
+                        dates=dates,
+                        export_format=export_format
+                    ),
+                    file_name=get_file_name(
+                        f'{start.strftime("%Y%m%d")}_{end.strftime("%Y%m%d")}_{technology_string}',
+                        export_format=export_format
+                    ),
+                    mime=get_mime_type(export_format=export_format)
+                )
+
+        # Display the companies whose mentions grow the fastest
+        with st.expander(label='Rising companies'):
+            rising_df = pd.DataFrame(
+                get_rising_companies(technology=st.session_state['technology'], date=select_date),
+                columns=['Name', 'Sum7', 'Sum30', 'Sum90', 'Growth', 'ZScore']
+            )
+            st.dataframe(rising_df)
+
+            # Forecast the mentions of a company
+            if not rising_df.empty:
+                company = st.selectbox(label='Forecast a company:', options=rising_df['Name'])
+
+                counts, forecast_counts = get_company_series(
+                    technology=st.session_state['technology'],
+                    name=company,
+                    date=select_date
+                )
+
+                # Display the daily counts followed by the forecast
+                days = pd.date_range(end=select_date, periods=len(counts))
+                st.line_chart(pd.DataFrame({
+                    'Count': pd.Series(counts, index=days),
+                    'Forecast': pd.Series(
+                        forecast_counts,
+                        index=pd.date_range(start=select_date + timedelta(days=1), periods=len(forecast_counts))
+                    )
+                }))
+
+        # Display the companies mentioned together with a company
+        if not st.session_state['df'].empty:
+            with st.expander(label='Related companies'):
+                company = st.selectbox(label='Company:', options=st.session_state['df']['Name'], key='related')
+
+                st.dataframe(pd.DataFrame(
+                    get_related_companies(
+                        technology=st.session_state['technology'],
+                        name=company,
+                        dates=(select_date,)
+                    ),
+                    columns=['Name', 'Articles']
+                ))
+
+        # Display timing panel
+        if show_timing and st.session_state['metrics'] is not None:
+            with st.expander(label='Timing', expanded=True):
+                # Counters of each stage
+                st.dataframe(
+                    pd.DataFrame.from_dict(st.session_state['metrics'], orient='index').drop(columns=['errors'])
+                )
+
+                # Failures of each stage by error
+                errors = {k: v['errors'] for k, v in st.session_state['metrics'].items() if v['errors']}
+                if errors:
+                    st.write('Failures:')
+                    st.json(errors)
+
+                # Cold start of the NER models
+                model_stats = get_model_stats()
+                if model_stats:
+                    st.write('NER models:')
+                    st.json(model_stats)
+
+                # Set 2 columns for the export options
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    # Save counters as JSON
+                    st.download_button(
+                        label='Download JSON',
+                        data=to_json(st.session_state['metrics']),
+                        file_name=f'{date_string}_{technology_string}_timing.json',
+                        mime='application/json'
+                    )
+                with col2:
+                    # Save counters in the Prometheus text format
+                    st.download_button(
+                        label='Download Prometheus',
+                        data=to_prometheus(st.session_state['metrics']),
+                        file_name=f'{date_string}_{technology_string}_timing.prom',
+                        mime='text/plain'
+                    )
+
 
 if __name__ == '__main__':
-    main()
+    # Count the work of this run apart from the other sessions
+    with metrics.scope():
+        main()
@@ -0,0 +1,238 @@
+import json
+import time
+from threading import Lock
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The counters of every stage
+COUNTERS = ('calls', 'seconds', 'items', 'failures', 'skipped', 'bytes', 'cache_hits', 'cache_misses', 'words_in',
+            'words_out')
+
+# The description of each counter in the Prometheus export
+DESCRIPTIONS = {
+    'calls': 'Number of times the stage ran.',
+    'seconds': 'Wall time spent in the stage.',
+    'items': 'Number of items the stage produced.',
+    'failures': 'Number of items the stage failed on.',
+    'skipped': 'Number of items the stage skipped, such as copies of the same story.',
+    'bytes': 'Number of bytes the stage downloaded.',
+    'cache_hits': 'Number of cache lookups of the stage that hit.',
+    'cache_misses': 'Number of cache lookups of the stage that missed.',
+    'words_in': 'Number of words the stage received.',
+    'words_out': 'Number of words the stage passed on.'
+}
+
+
+# The scoped counters the current code also adds to, such as the ones of its job
+_scopes = ContextVar('metrics_scopes', default=())
+
+
+class Metrics:
+    """This class records the wall time, items, failures, skipped items, bytes and cache lookups of each pipeline stage.
+
+    Counters only ever grow, so the cost of one run is the difference of two snapshots. The counters of this process
+    add up every job and session, the counters of a scope only the code run inside it, and the threads it starts
+    with the context copied.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stages = {}
+
+    def _stage(self, name: str) -> dict:
+        return self._stages.setdefault(name, {**{k: 0 for k in COUNTERS}, 'errors': {}})
+
+    def add(self, name: str, error: str = None, **counts) -> None:
+        """This function adds to the counters of a stage.
+
+        :param name: The name of the stage.
+        :param error: The name of the error a failed item raised, if any.
+        :param counts: The amounts to add to each counter.
+        """
+
+        # Add to the counters of this process and of every scope the code runs in
+        for target in (self, *_scopes.get()):
+            target._add(name, error, counts)
+
+    def _add(self, name: str, error: str, counts: dict) -> None:
+        with self._lock:
+            stage = self._stage(name)
+
+            for k, v in counts.items():
+                stage[k] += v
+
+            # Count failures by error
+            if error is not None:
+                stage['failures'] += 1
+                stage['errors'][error] = stage['errors'].get(error, 0) + 1
+
+    @contextmanager
+    def scope(self):
+        """This function records the counters a block of code adds apart from the code running at the same time, such
+        as one job among the other jobs and sessions of the process.
+
+        :return: The metrics of the block.
+        """
+
+        scoped = Metrics()
+        token = _scopes.set((*_scopes.get(), scoped))
+
+        try:
+            yield scoped
+        finally:
+            _scopes.reset(token)
+
+    def current_scope(self) -> 'Metrics':
+        """This function gets the innermost scope the code runs in.
+
+        :return: The metrics of the scope, or of the whole process outside any scope.
+        """
+
+        return (self, *_scopes.get())[-1]
+
+    def failed(self, name: str, e: BaseException) -> None:
+        """This function records an item the stage failed on.
+
+        :param name: The name of the stage.
+        :param e: The error.
+        """
+
+        self.add(name, error=type(e).__name__)
+
+    @contextmanager
+    def timer(self, name: str):
+        """This function times a block of code as one run of a stage.
+
+        :param name: The name of the stage.
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        except Exception as e:
+            self.failed(name, e)
+            raise
+        finally:
+            self.add(name, calls=1, seconds=time.perf_counter() - start)
+
+    def timed_iter(self, name: str, iterable, count=None):
+        """This function times a streaming stage, counting the time spent waiting for each of its items.
+
+        :param name: The name of the stage.
+        :param iterable: The stage.
+        :param count: The function giving the number of items in each yielded value, one by default.
+        :return: A generator of the items of the stage.
+        """
+
+        iterator = iter(iterable)
+        self.add(name, calls=1)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, seconds=time.perf_counter() - start)
+                return
+            except Exception as e:
+                self.failed(name, e)
+                raise
+
+            self.add(name, seconds=time.perf_counter() - start, items=count(item) if count else 1)
+
+            yield item
+
+    def snapshot(self) -> dict:
+        """This function copies the counters of every stage.
+
+        :return: The counters keyed by stage.
+        """
+
+        with self._lock:
+            return {k: {**v, 'errors': dict(v['errors'])} for k, v in self._stages.items()}
+
+    def diff(self, before: dict) -> dict:
+        """This function gets the counters added since a snapshot.
+
+        :param before: The earlier snapshot.
+        :return: The counters of each stage that ran since, with the cache hit rate and the reduction ratio.
+        """
+
+        # The stages that ran since the snapshot
+        stages = {}
+
+        for name, stage in self.snapshot().items():
+            previous = before.get(name, {**{k: 0 for k in COUNTERS}, 'errors': {}})
+            delta = {k: stage[k] - previous[k] for k in COUNTERS}
+            delta['errors'] = {
+                k: v - previous['errors'].get(k, 0) for k, v in stage['errors'].items()
+                if v != previous['errors'].get(k, 0)
+            }
+
+            if delta['calls'] or delta['items'] or delta['failures'] or delta['skipped']:
+                stages[name] = delta
+
+        return with_hit_rates(stages)
+
+
+def with_hit_rates(stages: dict) -> dict:
+    """This function adds the cache hit rate to the stages that looked up a cache, and the reduction ratio to the
+    stages that dropped words.
+
+    :param stages: The counters keyed by stage.
+    :return: The same counters with 'cache_hit_rate' and 'reduction_ratio', the words received per word passed on.
+    """
+
+    for stage in stages.values():
+        lookups = stage['cache_hits'] + stage['cache_misses']
+        stage['cache_hit_rate'] = stage['cache_hits'] / lookups if lookups else None
+        stage['reduction_ratio'] = stage['words_in'] / stage['words_out'] if stage['words_out'] else None
+
+    return stages
+
+
+def to_json(stages: dict) -> str:
+    """This function exports the counters of each stage as JSON.
+
+    :param stages: The counters keyed by stage.
+    :return: The JSON text.
+    """
+
+    return json.dumps(stages, indent=4, sort_keys=True)
+
+
+def to_prometheus(stages: dict, prefix: str = 'predictive_analysis') -> str:
+    """This function exports the counters of each stage in the Prometheus text format.
+
+    :param stages: The counters keyed by stage.
+    :param prefix: The prefix of the metric names.
+    :return: The Prometheus text.
+    """
+
+    # The exposition lines
+    lines = []
+
+    for counter in COUNTERS:
+        name = f'{prefix}_stage_{counter}_total'
+        lines.append(f'# HELP {name} {DESCRIPTIONS[counter]}')
+        lines.append(f'# TYPE {name} counter')
+
+        for stage_name, stage in sorted(stages.items()):
+            lines.append(f'{name}{{stage="{stage_name}"}} {stage[counter]}')
+
+    # Failures by error
+    name = f'{prefix}_stage_errors_total'
+    lines.append(f'# HELP {name} Number of items the stage failed on, by error.')
+    lines.append(f'# TYPE {name} counter')
+
+    for stage_name, stage in sorted(stages.items()):
+        for error, count in sorted(stage['errors'].items()):
+            lines.append(f'{name}{{stage="{stage_name}",error="{error}"}} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# The metrics of every stage of this process
+metrics = Metrics()
@@ -0,0 +1,57 @@
+import argparse
+from utils import *
+
+# The number of documents copied at once
+MIGRATION_CHUNK_SIZE = 1000
+
+
+def migrate_collection(collection_name: str, drop: bool = False) -> dict:
+    """This function copies a '{date}_{technology}' or '{date}_{technology}_prediction' collection to the unified
+    articles and predictions collections.
+
+    :param collection_name: The name of the old collection.
+    :param drop: If the old collection is dropped once it was copied.
+    :return: The number of documents inserted, updated and failed.
+    """
+
+    # Get 'ARLIS' mongoDB database
+    db = init_connection()
+
+    # Get documents of the old collection
+    documents = db[collection_name].find({}, {'_id': False})
+
+    # Copy documents a chunk at a time
+    result = store_documents(documents=documents, collection_name=collection_name, chunk_size=MIGRATION_CHUNK_SIZE)
+
+    # Drop the old collection once every document was copied
+    if drop and not result['failed']:
+        db[collection_name].drop()
+
+    return result
+
+
+def main():
+    # Command line arguments
+    parser = argparse.ArgumentParser(description='Copy the per-day collections to the unified collections.')
+    parser.add_argument('--drop', action='store_true', help='Drop each old collection once it was fully copied.')
+    args = parser.parse_args()
+
+    # Get 'ARLIS' mongoDB database
+    db = init_connection()
+
+    # The old collections, named '{date}_{technology}' or '{date}_{technology}_prediction'
+    collection_names = sorted(
+        name for name in db.list_collection_names()
+        if re.fullmatch(r'\d{8}_.+', name)
+    )
+
+    for i, collection_name in enumerate(collection_names, start=1):
+        # Copy collection
+        result = migrate_collection(collection_name=collection_name, drop=args.drop)
+
+        print(f'[{i}/{len(collection_names)}] {collection_name}: {result["inserted"]} inserted, '
+              f'{result["updated"]} updated, {result["failed"]} failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+import os
+import time
+import queue
+import hashlib
+import psutil
+import threading
+import contextvars
+import multiprocessing
+from threading import Lock
+from collections import deque
+from importlib.metadata import version
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sentiment import get_lexicon, score_mentions
+
+# The default spaCy pipeline for Name Entity Recognition (NER)
+DEFAULT_MODEL = 'en_core_web_lg'
+
+# The pipeline matching only the known company names of the gazetteer
+GAZETTEER_MODEL = 'gazetteer'
+
+# The gazetteer of known company names, one per line
+DEFAULT_GAZETTEER_PATH = '.cache/gazetteer.txt'
+
+# The speed tiers of Name Entity Recognition, from the fastest to the most accurate
+TIERS = {
+    'gazetteer': GAZETTEER_MODEL,
+    'small': 'en_core_web_sm',
+    'large': DEFAULT_MODEL
+}
+
+# The tier of interactive requests
+DEFAULT_TIER = 'large'
+
+# The pipeline components that Name Entity Recognition does not need
+EXCLUDED_COMPONENTS = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
+
+# The number of texts spaCy processes together in nlp.pipe
+DEFAULT_BATCH_SIZE = 64
+
+# The seconds a partial chunk waits for more texts before it is processed anyway
+FLUSH_SECONDS = 0.5
+
+# The seconds between two checks for finished chunks while waiting for texts
+POLL_SECONDS = 0.05
+
+# The marker that there are no more texts
+_DONE = object()
+
+# The spaCy pipelines loaded in this process, keyed by model name
+_models = {}
+
+# The cold-start statistics of each loaded spaCy pipeline
+_model_stats = {}
+
+# The cold-start statistics of the spaCy pipelines loaded by the NER worker processes, keyed by model and worker
+_worker_model_stats = {}
+
+# The pipelines of this worker process whose cold-start statistics were sent to the parent process
+_reported_models = set()
+
+# The lock so two threads never load the same pipeline twice
+_models_lock = Lock()
+
+# The NER worker pools of this process, keyed by number of workers, started once so each worker loads its pipeline once
+_pools = {}
+
+# The lock so two threads never start the same pool twice
+_pools_lock = Lock()
+
+
+def get_resident_memory() -> int:
+    """This function gets the resident memory of the current process.
+
+    :return: The resident set size in bytes.
+    """
+
+    return psutil.Process().memory_info().rss
+
+
+def get_model_name(tier: str = DEFAULT_TIER) -> str:
+    """This function gets the spaCy pipeline of a speed tier.
+
+    :param tier: 'gazetteer', 'small' or 'large'.
+    :return: The name of the spaCy pipeline.
+    """
+
+    if tier not in TIERS:
+        raise ValueError(f'Unknown NER tier {tier!r}, choose one of {", ".join(TIERS)}.')
+
+    return TIERS[tier]
+
+
+def get_gazetteer_path() -> str:
+    """This function gets the gazetteer file, GAZETTEER_PATH in the environment so worker processes find it too.
+
+    :return: The path of the gazetteer.
+    """
+
+    return os.environ.get('GAZETTEER_PATH', DEFAULT_GAZETTEER_PATH)
+
+
+def read_gazetteer(path: str) -> list:
+    """This function reads the known company names.
+
+    :param path: The path of the gazetteer.
+    :return: The company names, none if the gazetteer was never written.
+    """
+
+    if not os.path.exists(path):
+        return []
+
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_gazetteer(names, path: str) -> int:
+    """This function writes the known company names.
+
+    :param names: The iterable of company names.
+    :param path: The path of the gazetteer.
+    :return: The number of company names written.
+    """
+
+    # Sort names so the same names always give the same gazetteer version
+    names = sorted({name.strip() for name in names if name and name.strip()})
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(names))
+
+    return len(names)
+
+
+def build_gazetteer(names: list) -> 'spacy.language.Language':
+    """This function compiles the known company names into a pipeline of a tokenizer and an entity ruler.
+
+    :param names: The company names.
+    :return: The spaCy pipeline, labelling each known name as ORG whatever its case.
+    """
+
+    import spacy
+
+    # Tokenizer only, the entity ruler matches the names
+    nlp = spacy.blank('en')
+    ruler = nlp.add_pipe('entity_ruler', config={'phrase_matcher_attr': 'LOWER'})
+    ruler.add_patterns([{'label': 'ORG', 'pattern': name} for name in names])
+
+    return nlp
+
+
+def load_model(model_name: str = DEFAULT_MODEL) -> 'spacy.language.Language':
+    """This function gets a spaCy pipeline, loading it once per process on first use.
+
+    :param model_name: The name of the spaCy pipeline.
+    :return: The spaCy pipeline with only the components needed for NER.
+    """
+
+    # A gazetteer is compiled again once its names change
+    key = get_model_version(model_name) if model_name == GAZETTEER_MODEL else model_name
+
+    # Return the pipeline if it was already loaded
+    if key in _models:
+        return _models[key]
+
+    with _models_lock:
+        # Another thread may have loaded the pipeline while waiting for the lock
+        if key in _models:
+            return _models[key]
+
+        # Resident memory and time before loading
+        memory_before = get_resident_memory()
+        start = time.perf_counter()
+
+        # Imported with the first pipeline, so the app starts without loading spaCy
+        import spacy
+
+        if model_name == GAZETTEER_MODEL:
+            # Compile the known company names, with rule-based sentence boundaries for sentiment
+            nlp = build_gazetteer(read_gazetteer(get_gazetteer_path()))
+            nlp.add_pipe('sentencizer', first=True)
+        else:
+            # Load the pipeline without the tagger, parser and lemmatizer
+            nlp = spacy.load(model_name, exclude=EXCLUDED_COMPONENTS)
+
+            # The sentence recognizer is much cheaper than the parser the sentiment would otherwise need
+            if 'senter' in nlp.disabled:
+                nlp.enable_pipe('senter')
+
+        # Record the cold-start cost
+        _model_stats[key] = {
+            'load_seconds': time.perf_counter() - start,
+            'resident_memory_bytes': get_resident_memory() - memory_before,
+            'pipeline': list(nlp.pipe_names)
+        }
+
+        _models[key] = nlp
+
+    return nlp
+
+
+def get_model_version(model_name: str = DEFAULT_MODEL) -> str:
+    """This function gets the installed version of a spaCy pipeline without loading it.
+
+    :param model_name: The name of the spaCy pipeline.
+    :return: The model name and version, such as 'en_core_web_lg-3.3.0'.
+    """
+
+    # The gazetteer version is the hash of its names
+    if model_name == GAZETTEER_MODEL:
+        if not os.path.exists(get_gazetteer_path()):
+            raise FileNotFoundError(f'The gazetteer {get_gazetteer_path()} was never written, '
+                                    f'run python batch.py --update-gazetteer first.')
+
+        with open(get_gazetteer_path(), 'rb') as f:
+            return f'{model_name}-{hashlib.sha1(f.read()).hexdigest()[:12]}'
+
+    # Read the package metadata, importing spaCy would slow down the first page load
+    return f'{model_name}-{version(model_name)}'
+
+
+def get_model_stats() -> dict:
+    """This function gets the load time and resident memory of every loaded spaCy pipeline, in this process and in
+    the NER worker processes.
+
+    :return: The statistics keyed by model name, and by model name and worker for the worker processes.
+    """
+
+    return {k: dict(v) for k, v in {**_model_stats, **_worker_model_stats}.items()}
+
+
+def count_entities(doc: 'spacy.tokens.Doc', lexicon: dict = None) -> dict:
+    """This function counts the companies in one spaCy document, with the sentiment of the sentences mentioning them.
+
+    :param doc: The spaCy document.
+    :param lexicon: The valence of each lowercase word, or None to only count.
+    :return: The companies stored in a dictionary with counts, and the sum and sum of squares of the sentiment of their
+        mentions, so partial counts can be merged.
+    """
+
+    # The companies dictionary
+    companies = {}
+
+    # The company appearances in the document
+    mentions = [word for word in doc.ents if word.label_ == 'ORG']
+
+    # Score the sentence of every mention at once, reusing the document NER parsed
+    scores = score_mentions(doc, mentions, lexicon) if lexicon is not None else [None] * len(mentions)
+
+    # Count the number of company appearances in the document
+    for word, score in zip(mentions, scores):
+        # Convert word to string
+        word = str(word)
+
+        # Add word to companies dictionary
+        company = companies.setdefault(word, {'Count': 0})
+        company['Count'] += 1
+
+        # Add the sentiment of the mention
+        if score is not None:
+            company['SentimentSum'] = company.get('SentimentSum', 0.0) + float(score)
+            company['SentimentSquares'] = company.get('SentimentSquares', 0.0) + float(score) ** 2
+
+    return companies
+
+
+def merge_companies(companies: dict, partial: dict) -> dict:
+    """This function merges partial company counts into the companies dictionary.
+
+    :param companies: The dictionary of companies.
+    :param partial: The partial company counts, with their sentiment sums.
+    :return: The companies stored in a dictionary with counts.
+    """
+
+    # Add each partial count and sum to companies dictionary
+    for k, v in partial.items():
+        company = companies.setdefault(k, {})
+
+        for counter, value in v.items():
+            company[counter] = company.get(counter, 0) + value
+
+    return companies
+
+
+def _count_companies_chunk(texts: list, model_name: str, batch_size: int, sentiment: bool) -> (list, dict):
+    """This function counts the companies of each text in a chunk, in a worker process.
+
+    :param texts: The article texts.
+    :param model_name: The name of the spaCy pipeline.
+    :param batch_size: The number of texts spaCy processes together.
+    :param sentiment: If the sentiment of the mentions is scored, only if the parent process found the lexicon.
+    :return: The partial company counts, one per text, and the cold-start statistics of the pipelines the worker
+        loaded since its last chunk, which the parent process can't see.
+    """
+
+    # The NLP and sentiment lexicon, loaded once per worker process
+    nlp = load_model(model_name)
+    lexicon = get_lexicon() if sentiment else None
+
+    results = [count_entities(doc, lexicon) for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+    # Send the statistics of each pipeline once, with the first chunk it processed
+    stats = {key: dict(value) for key, value in _model_stats.items() if key not in _reported_models}
+    _reported_models.update(stats)
+
+    return results, {f'{key} (worker {os.getpid()})': value for key, value in stats.items()}
+
+
+def _get_chunk_results(future) -> list:
+    # Get the counts of a chunk, keeping the cold-start statistics of its worker
+    results, stats = future.result()
+
+    if stats:
+        with _models_lock:
+            _worker_model_stats.update(stats)
+
+    return results
+
+
+def get_worker_pool(n_process: int) -> ProcessPoolExecutor:
+    """This function gets the NER worker pool of this process, starting it the first time.
+
+    The workers live as long as the process, so the pipelines they load are reused by every later prediction instead
+    of being loaded again by new workers each time.
+
+    :param n_process: The number of worker processes.
+    :return: The worker pool.
+    """
+
+    with _pools_lock:
+        if n_process not in _pools:
+            # Spawn the workers, forking while download threads hold locks can deadlock
+            _pools[n_process] = ProcessPoolExecutor(
+                max_workers=n_process,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+        return _pools[n_process]
+
+
+def _discard_worker_pool(n_process: int, executor: ProcessPoolExecutor) -> None:
+    # Forget a pool whose worker died, so the next call starts a new one
+    with _pools_lock:
+        if _pools.get(n_process) is executor:
+            del _pools[n_process]
+
+    executor.shutdown(wait=False)
+
+
+def iter_companies_batch(texts, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = None,
+                         model_name: str = DEFAULT_MODEL):
+    """This function runs Name Entity Recognition on texts in batches, optionally across processes.
+
+    Across processes, each chunk is yielded as soon as it is done, and a partial chunk is processed once the workers
+    are idle or it waited FLUSH_SECONDS, so the first companies are counted within seconds of the first texts.
+
+    :param texts: The iterable of article texts.
+    :param batch_size: The number of texts spaCy processes together.
+    :param n_process: The number of worker processes, defaults to the number of cores.
+    :param model_name: The name of the spaCy pipeline.
+    :return: A generator of partial company counts with sentiment sums, one per text and in the same order.
+    """
+
+    # Use every core by default
+    if n_process is None:
+        n_process = os.cpu_count() or 1
+
+    # Run in this process when there is a single worker
+    if n_process == 1:
+        nlp = load_model(model_name)
+        lexicon = get_lexicon()
+
+        for doc in nlp.pipe(texts, batch_size=batch_size):
+            yield count_entities(doc, lexicon)
+
+        return
+
+    # Check the sentiment lexicon here, so a missing one is reported once rather than by every worker
+    sentiment = get_lexicon() is not None
+
+    # The long-lived workers of this process, shared by every prediction
+    executor = get_worker_pool(n_process)
+
+    # The texts read ahead by the feeder thread, so waiting for texts never keeps finished chunks from being yielded
+    pending = queue.Queue(maxsize=batch_size)
+
+    # Set when the texts are no longer needed
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Wait for room in the queue unless the texts are no longer needed
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def feed():
+        try:
+            for text in texts:
+                if not put((text, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+        finally:
+            # Let a generator of texts clean up in the thread that ran it
+            if hasattr(texts, 'close'):
+                texts.close()
+
+    # Start feeder, counting its metrics in the scope of the caller
+    threading.Thread(target=contextvars.copy_context().run, args=(feed,), daemon=True).start()
+
+    # The chunks being processed, at most two per worker so memory stays bounded
+    futures = deque()
+
+    # The texts of the next chunk, when its first text arrived, and if every text was read
+    chunk, started, finished, error = [], None, False, None
+
+    try:
+        while True:
+            # Yield the chunks at the head as soon as they are done, in the order of the texts
+            while futures and futures[0].done():
+                yield from _get_chunk_results(futures.popleft())
+
+            # Process the partial chunk once every text was read, then wait for the last chunks
+            if finished:
+                if chunk:
+                    futures.append(executor.submit(_count_companies_chunk, chunk, model_name, batch_size, sentiment))
+                    chunk = []
+                elif futures:
+                    yield from _get_chunk_results(futures.popleft())
+                elif error is not None:
+                    raise error
+                else:
+                    return
+
+                continue
+
+            # Wait for the oldest chunk once every worker is busy
+            if len(futures) >= 2 * n_process:
+                yield from _get_chunk_results(futures.popleft())
+                continue
+
+            try:
+                text, error = pending.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+            else:
+                if text is _DONE:
+                    finished = True
+                    continue
+
+                if not chunk:
+                    started = time.monotonic()
+                chunk.append(text)
+
+            # Process a full chunk, a partial one once it waited long enough, or right away if the workers are idle
+            if chunk and (len(chunk) >= batch_size or time.monotonic() - started >= FLUSH_SECONDS
+                          or not futures and pending.empty()):
+                futures.append(executor.submit(_count_companies_chunk, chunk, model_name, batch_size, sentiment))
+                chunk = []
+    except BrokenProcessPool:
+        _discard_worker_pool(n_process, executor)
+        raise
+    finally:
+        stop.set()
+
+        # Drop the chunks of a prediction stopped early
+        for future in futures:
+            future.cancel()
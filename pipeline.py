@@ -0,0 +1,355 @@
+import time
+import queue
+import threading
+import contextvars
+from utils import *
+from jobs import Job, JobRunner
+from dedup import NearDuplicateIndex, deduplicate
+from resolution import resolve_companies
+from ner import merge_companies
+
+# The number of items waiting between two pipeline stages
+DEFAULT_QUEUE_SIZE = 256
+
+# The seconds between two progress updates of a prediction job
+PROGRESS_INTERVAL = 1.0
+
+# The number of companies kept in the partial results of a prediction job
+PARTIAL_COMPANIES = 20
+
+# The marker that a pipeline stage has no more items
+_DONE = object()
+
+
+def threaded(iterable, maxsize: int = DEFAULT_QUEUE_SIZE):
+    """This function runs a pipeline stage in its own thread, handing items over through a bounded queue.
+
+    :param iterable: The pipeline stage.
+    :param maxsize: The number of items that may wait in the queue.
+    :return: A generator of the items of the stage, as soon as each one is ready.
+    """
+
+    # The queue between this stage and the next one
+    items = queue.Queue(maxsize=maxsize)
+
+    # Set when the next stage stops early
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Wait for room in the queue unless the next stage stopped
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+        finally:
+            # Let a generator stage clean up in the thread that ran it
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    # Start stage, counting its metrics in the scope of the caller
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+
+            if item is _DONE:
+                # Raise the error of the stage in the next stage
+                if error is not None:
+                    raise error
+
+                return
+
+            yield item
+    finally:
+        stop.set()
+
+
+def fetch_pages(date: datetime.date, technology: str, page_size: int = 100):
+    """This function fetches the newscatcherapi articles of a technology on a date, several pages at a time.
+
+    :param date: The date.
+    :param technology: The technology.
+    :param page_size: The number of articles per page.
+    :return: A generator of the articles list of each page, in the order pages arrive.
+    """
+
+    # The dates
+    from_ = date.strftime('%Y/%m/%d')
+    to_ = (date + timedelta(days=1)).strftime('%Y/%m/%d')
+
+    # Get pages, the news source paces and rotates the keys of every search of the process
+    pages = get_news_source().search_pages(
+        q=technology.lower(),
+        from_=from_,
+        to_=to_,
+        lang='en',
+        page_size=page_size
+    )
+
+    yield from metrics.timed_iter('consume_api', pages, count=len)
+
+
+def store_pages(pages, date: datetime.date, technology: str):
+    """This function stores each page of articles in mongoDB Atlas database as soon as it arrives.
+
+    The day is marked fetched only after its last page, so a fetch stopped after some pages is fetched again, and the
+    articles stored before are upserted rather than duplicated.
+
+    :param pages: The iterable of articles lists.
+    :param date: The date.
+    :param technology: The technology.
+    :return: A generator of the stored articles.
+    """
+
+    # The collection name
+    collection_name = get_collection_name(date=date, technology=technology)
+
+    # The number of articles stored
+    count = 0
+
+    for articles in pages:
+        # Insert articles in database to save time
+        if articles:
+            store_documents(documents=articles, collection_name=collection_name)
+            count += len(articles)
+
+        yield from articles
+
+    # Read the stored articles next time
+    store_fetch_completion(date=date, technology=technology, articles_count=count)
+
+
+def weigh_companies(companies: dict, weight: int) -> dict:
+    """This function multiplies the counts of a companies dictionary.
+
+    :param companies: The companies stored in a dictionary with counts.
+    :param weight: The weight, such as the number of copies of the story.
+    :return: The weighted companies dictionary.
+    """
+
+    return {name: {k: v * weight for k, v in values.items()} for name, values in companies.items()}
+
+
+def aggregate_companies(results, index: NearDuplicateIndex = None, cooccurrence=None):
+    """This function merges the company counts of each article into running totals of canonical companies.
+
+    :param results: The iterable of (url, companies dictionary) per article.
+    :param index: The near-duplicate index, to weigh each story by its number of copies once every copy was found.
+    :param cooccurrence: The co-occurrence matrix to add the companies of each article to, if any.
+    :return: A generator of (number of articles counted, companies dictionary) after each article.
+    """
+
+    # The registry of canonical companies
+    registry = get_entity_registry()
+
+    # The companies dictionary
+    companies = {}
+
+    # The counts of each story, kept only to weigh them
+    partials = {}
+
+    # The number of articles counted
+    count = 0
+
+    for count, (url, partial) in enumerate(results, start=1):
+        # Count the names of the same company as one
+        partial = resolve_companies(partial, registry)
+        merge_companies(companies, partial)
+
+        # Pair the companies found together
+        if cooccurrence is not None:
+            cooccurrence.add(partial)
+
+        if index is not None:
+            partials[url] = partial
+
+        yield count, companies
+
+    # Weigh each story by its number of copies, which is only known once every article was found
+    if index is not None:
+        weighted = {}
+
+        for url, partial in partials.items():
+            merge_companies(weighted, weigh_companies(partial, index.multiplicity(url)))
+
+        yield count, weighted
+
+
+def stream_prediction(date: datetime.date, technology: str, articles=None, batch_size: int = DEFAULT_BATCH_SIZE,
+                      n_process: int = None, maxsize: int = DEFAULT_QUEUE_SIZE, weighted: bool = False,
+                      tier: str = DEFAULT_TIER, cooccurrence=None):
+    """This function streams a prediction from newscatcherapi pages through NER to running company counts.
+
+    Every stage runs in its own thread and hands items to the next one through a bounded queue, so the first
+    companies are counted within seconds and memory stays flat however many articles there are. Stopping early
+    keeps every article counted so far in the per-article cache. Copies of the same story are skipped before they are
+    downloaded, and only the passages about the technology go through NER.
+
+    :param date: The date.
+    :param technology: The technology.
+    :param articles: The iterable of articles, or None to read the stored articles or fetch them from newscatcherapi.
+    :param batch_size: The number of article texts spaCy processes together.
+    :param n_process: The number of NER worker processes, defaults to the number of cores.
+    :param maxsize: The number of items that may wait between two stages.
+    :param weighted: If each story is counted as many times as it was copied, in a last companies dictionary.
+    :param tier: The NER speed tier, 'gazetteer', 'small' or 'large'.
+    :param cooccurrence: The co-occurrence matrix to add the companies of each article to, if any.
+    :return: A generator of (number of articles counted, companies dictionary) after each article.
+    """
+
+    # The collection name
+    collection_name = get_collection_name(date=date, technology=technology)
+
+    # Read the stored articles once they were all stored
+    if articles is None and articles_fetched(date=date, technology=technology):
+        articles = get_cursor(
+            collection_name=collection_name,
+            projection={'link': True, 'title': True, 'summary': True}
+        )
+
+    # Fetch and store the articles page by page if they were never all stored
+    if articles is None:
+        pages = threaded(fetch_pages(date=date, technology=technology), maxsize=maxsize)
+        articles = store_pages(pages, date=date, technology=technology)
+
+    # Skip the copies of the same story, by title and summary
+    index = NearDuplicateIndex()
+    articles = metrics.timed_iter('deduplicate', deduplicate(articles, index=index))
+
+    # Download each article as soon as it is stored
+    articles = threaded(articles, maxsize=maxsize)
+    # Count the companies of the passages about the technology
+    results = threaded(
+        iter_article_companies(articles, batch_size=batch_size, n_process=n_process, technology=technology, tier=tier),
+        maxsize=maxsize
+    )
+
+    yield from aggregate_companies(results, index=index if weighted else None, cooccurrence=cooccurrence)
+
+    # Record the copies of each story
+    store_duplicates(clusters=index.clusters)
+
+
+def compute_prediction(date: datetime.date, technology: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                       n_process: int = None, weighted: bool = False, tier: str = DEFAULT_TIER,
+                       job: Job = None) -> dict:
+    """This function computes and stores the prediction of a technology on a date.
+
+    :param date: The date.
+    :param technology: The technology.
+    :param batch_size: The number of article texts spaCy processes together.
+    :param n_process: The number of NER worker processes, defaults to the number of cores.
+    :param weighted: If each story is counted as many times as it was copied.
+    :param tier: The NER speed tier, 'gazetteer' or 'small' for backfills, 'large' for interactive requests.
+    :param job: The background job to report progress to, if any.
+    :return: The companies stored in a dictionary with counts.
+    """
+
+    # scipy is loaded with the first prediction computed, not with the app
+    from cooccurrence import CooccurrenceMatrix
+
+    # Count the work of this prediction apart from the other jobs and sessions
+    with metrics.scope() as job_metrics:
+        # The companies dictionary
+        companies = {}
+
+        # The articles each pair of companies is found in
+        cooccurrence = CooccurrenceMatrix()
+
+        # The time of the last progress update
+        updated = time.monotonic()
+
+        # Count the companies of every article
+        for articles_processed, companies in stream_prediction(
+                date=date,
+                technology=technology,
+                batch_size=batch_size,
+                n_process=n_process,
+                weighted=weighted,
+                tier=tier,
+                cooccurrence=cooccurrence
+        ):
+            # Report the companies found so far about once a second
+            if job is not None and time.monotonic() - updated >= PROGRESS_INTERVAL:
+                job.update(
+                    articles_processed=articles_processed,
+                    companies_found=len(companies),
+                    top_companies=sorted(dictionary_to_list(companies), key=lambda c: -c['Count'])[:PARTIAL_COMPANIES]
+                )
+                updated = time.monotonic()
+
+        # Store companies in the database
+        store_prediction(
+            companies=companies,
+            collection_name=f'{get_collection_name(date=date, technology=technology)}_prediction'
+        )
+
+        # Add the day to the series of each company
+        update_series(companies=companies, date=date, technology=technology)
+
+        # Store the pairs of companies found together
+        store_cooccurrence(cooccurrence=cooccurrence, date=date, technology=technology)
+
+        # Never compute the day again, even if it has no company
+        store_completion(date=date, technology=technology, companies_count=len(companies))
+
+        # Report where the job spent its time, without the other jobs running at the same time
+        if job is not None:
+            job.update(metrics=job_metrics.diff({}))
+
+    return companies
+
+
+@st.experimental_singleton
+def get_job_runner() -> JobRunner:
+    """This function creates the background job runner shared by every session of the app.
+
+    :return: The job runner.
+    """
+
+    return JobRunner()
+
+
+def submit_prediction(date: datetime.date, technology: str, retry: bool = False) -> Job:
+    """This function computes a prediction in the background, once however many pages ask for it.
+
+    :param date: The date.
+    :param technology: The technology.
+    :param retry: If a failed prediction is computed again, otherwise its failed job is returned.
+    :return: The prediction job.
+    """
+
+    return get_job_runner().submit(
+        f'{get_collection_name(date=date, technology=technology)}_prediction',
+        compute_prediction,
+        date=date,
+        technology=technology,
+        retry=retry
+    )
+
+
+def get_prediction_job(date: datetime.date, technology: str) -> Job:
+    """This function gets the background job of a prediction.
+
+    :param date: The date.
+    :param technology: The technology.
+    :return: The prediction job, or None if there isn't any.
+    """
+
+    return get_job_runner().get(f'{get_collection_name(date=date, technology=technology)}_prediction')
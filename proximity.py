@@ -0,0 +1,195 @@
+import re
+import csv
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# The file of the DoD installations, a CSV with a name, latitude and longitude per installation
+DEFAULT_INSTALLATIONS_PATH = '.cache/installations.csv'
+
+# The file of the ZIP code centroids, such as the ZCTA gazetteer file of the Census Bureau
+DEFAULT_ZIP_CENTROIDS_PATH = '.cache/zip_centroids.txt'
+
+# The columns of the installations file
+DEFAULT_NAME_COLUMN = 'Site Name'
+DEFAULT_LATITUDE_COLUMN = 'Latitude'
+DEFAULT_LONGITUDE_COLUMN = 'Longitude'
+
+# The columns of the ZIP code centroids file
+DEFAULT_ZIP_COLUMN = 'GEOID'
+DEFAULT_ZIP_LATITUDE_COLUMN = 'INTPTLAT'
+DEFAULT_ZIP_LONGITUDE_COLUMN = 'INTPTLONG'
+
+# The mean radius of the Earth, in miles
+EARTH_RADIUS = 3958.8
+
+# The distance from an installation within which a company is close to it, in miles
+DEFAULT_RADIUS = 50.0
+
+# The five-digit ZIP code at the start of a ZIP or ZIP+4 code
+ZIP_PATTERN = re.compile(r'\d{5}')
+
+# The country codes of the addresses in the United States, the only ones with ZIP codes
+US_COUNTRY_CODES = ('USA', 'US')
+
+
+def _read_points(path: str, key_column: str, latitude_column: str, longitude_column: str,
+                 delimiter: str = ',') -> (list, np.ndarray):
+    # Read the key and coordinates of each row, skipping the rows without coordinates
+    keys, points = [], []
+
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+
+        for row in reader:
+            # Strip the padding of the column names of the Census files
+            row = {k.strip(): v for k, v in row.items() if k is not None}
+
+            try:
+                point = (float(row[latitude_column]), float(row[longitude_column]))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            keys.append(row.get(key_column, '').strip())
+            points.append(point)
+
+    return keys, np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+class ZipGeocoder:
+    """This class geocodes the addresses of companies to the centroid of their ZIP code, offline.
+
+    :param path: The file of the ZIP code centroids, tab-delimited like the gazetteer files of the Census Bureau.
+    :param delimiter: The delimiter of the file.
+    :param zip_column: The column of the ZIP code.
+    :param latitude_column: The column of the latitude.
+    :param longitude_column: The column of the longitude.
+    """
+
+    def __init__(self, path: str = DEFAULT_ZIP_CENTROIDS_PATH, delimiter: str = '\t',
+                 zip_column: str = DEFAULT_ZIP_COLUMN, latitude_column: str = DEFAULT_ZIP_LATITUDE_COLUMN,
+                 longitude_column: str = DEFAULT_ZIP_LONGITUDE_COLUMN):
+        zips, points = _read_points(path, zip_column, latitude_column, longitude_column, delimiter=delimiter)
+
+        # The coordinates of each ZIP code
+        self.centroids = dict(zip(zips, map(tuple, points)))
+
+    def __len__(self) -> int:
+        return len(self.centroids)
+
+    def geocode(self, zips, countries) -> np.ndarray:
+        """This function gets the coordinates of each address in the United States from its ZIP code.
+
+        Postal codes of other countries can look like ZIP codes, such as 10115 in Berlin, so they are never geocoded.
+
+        :param zips: The iterable of ZIP or postal codes, None for a company without one.
+        :param countries: The iterable of the country code of each address.
+        :return: The latitude and longitude of each address in degrees, NaN if it is not in the United States or its
+            ZIP code is unknown.
+        """
+
+        # The coordinates of an unknown address
+        unknown = (np.nan, np.nan)
+
+        coordinates = []
+
+        for zip_code, country in zip(zips, countries):
+            match = ZIP_PATTERN.match((zip_code or '').strip())
+
+            if match is None or (country or '').strip().upper() not in US_COUNTRY_CODES:
+                coordinates.append(unknown)
+            else:
+                coordinates.append(self.centroids.get(match.group(), unknown))
+
+        return np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+
+
+class InstallationIndex:
+    """This class finds the DoD installations near companies with a ball tree on the haversine distance.
+
+    The tree answers radius and nearest queries for thousands of companies at once in milliseconds, since each
+    query only visits the installations of the nearby branches.
+
+    :param names: The names of the installations.
+    :param points: The latitude and longitude of each installation in degrees.
+    """
+
+    def __init__(self, names: list, points: np.ndarray):
+        self.names = names
+
+        # Build the tree on radians, as the haversine distance expects, a tree can't be empty
+        self.tree = BallTree(np.radians(points), metric='haversine') if len(points) else None
+
+    @classmethod
+    def from_csv(cls, path: str = DEFAULT_INSTALLATIONS_PATH, name_column: str = DEFAULT_NAME_COLUMN,
+                 latitude_column: str = DEFAULT_LATITUDE_COLUMN,
+                 longitude_column: str = DEFAULT_LONGITUDE_COLUMN) -> 'InstallationIndex':
+        """This function builds the index of the installations of a CSV file.
+
+        :param path: The CSV file of the installations, with a header.
+        :param name_column: The column of the installation name.
+        :param latitude_column: The column of the latitude.
+        :param longitude_column: The column of the longitude.
+        :return: The installation index.
+        """
+
+        return cls(*_read_points(path, name_column, latitude_column, longitude_column))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def nearest(self, points: np.ndarray, k: int = 1) -> list:
+        """This function finds the k nearest installations of each point.
+
+        :param points: The latitude and longitude of each point in degrees, NaN for a point without coordinates.
+        :param k: The number of installations.
+        :return: The installations with their distance in miles, nearest first, of each point.
+        """
+
+        # The points with coordinates
+        known = ~np.isnan(points).any(axis=1)
+        results = [[] for _ in range(len(points))]
+
+        if not known.any() or not len(self.names):
+            return results
+
+        # Query every point at once
+        distances, indices = self.tree.query(np.radians(points[known]), k=min(k, len(self.names)))
+
+        for i, row_distances, row_indices in zip(np.flatnonzero(known), distances, indices):
+            results[i] = [
+                {'Installation': self.names[j], 'Distance': float(d * EARTH_RADIUS)}
+                for d, j in zip(row_distances, row_indices)
+            ]
+
+        return results
+
+    def within(self, points: np.ndarray, radius: float = DEFAULT_RADIUS) -> list:
+        """This function finds the installations within a radius of each point.
+
+        :param points: The latitude and longitude of each point in degrees, NaN for a point without coordinates.
+        :param radius: The radius in miles.
+        :return: The installations with their distance in miles, nearest first, of each point.
+        """
+
+        # The points with coordinates
+        known = ~np.isnan(points).any(axis=1)
+        results = [[] for _ in range(len(points))]
+
+        if not known.any() or not len(self.names):
+            return results
+
+        # Query every point at once
+        indices, distances = self.tree.query_radius(
+            np.radians(points[known]),
+            r=radius / EARTH_RADIUS,
+            return_distance=True,
+            sort_results=True
+        )
+
+        for i, row_indices, row_distances in zip(np.flatnonzero(known), indices, distances):
+            results[i] = [
+                {'Installation': self.names[j], 'Distance': float(d * EARTH_RADIUS)}
+                for d, j in zip(row_distances, row_indices)
+            ]
+
+        return results
@@ -0,0 +1,108 @@
+import re
+import hashlib
+from metrics import metrics
+
+# The number of sentences kept before and after each sentence mentioning the technology
+DEFAULT_WINDOW = 1
+
+# The number of sentences kept from an article that never mentions the technology
+LEAD_SENTENCES = 3
+
+# The end of a sentence, followed by the capital letter, digit or quote starting the next one
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+(?=["\'“(]?[A-Z0-9])')
+
+# The acronym of a technology, such as 'PNT' in 'Resilient positioning, navigation, and timing (PNT)'
+ACRONYM_PATTERN = re.compile(r'\(([^)]+)\)')
+
+# The separators of the parts of a technology name
+PART_PATTERN = re.compile(r',\s*(?:and\s+|or\s+)?|\s+and\s+|\s+or\s+')
+
+
+def split_sentences(text: str) -> list:
+    """This function splits an article text into sentences, without loading a spaCy pipeline.
+
+    :param text: The article text.
+    :return: The sentences.
+    """
+
+    return [sentence for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+
+def get_terms(names) -> list:
+    """This function gets the phrases that mark a passage as relevant to technologies.
+
+    :param names: The technology and subfield names.
+    :return: The lowercase phrases, the names, their parts and their acronyms.
+    """
+
+    # The phrases
+    terms = set()
+
+    for name in names:
+        # Get acronyms
+        terms.update(acronym.strip().lower() for acronym in ACRONYM_PATTERN.findall(name))
+
+        # Get name and its parts, 'navigation' in 'Resilient positioning, navigation, and timing'
+        name = ACRONYM_PATTERN.sub('', name).strip().lower()
+        terms.add(name)
+        terms.update(part.strip() for part in PART_PATTERN.split(name))
+
+    return sorted(term for term in terms if term)
+
+
+class RelevanceFilter:
+    """This class keeps the sentences of an article that mention a technology, with the sentences around them.
+
+    Name Entity Recognition then only runs on the passages about the technology instead of the whole article with
+    its boilerplate, author bios and unrelated sections.
+
+    :param terms: The phrases that mark a passage as relevant.
+    :param window: The number of sentences kept before and after each sentence mentioning a phrase.
+    """
+
+    def __init__(self, terms: list, window: int = DEFAULT_WINDOW):
+        self.terms = sorted(terms)
+        self.window = window
+
+        # Match every phrase in one pass, longest first, on word boundaries
+        alternatives = '|'.join(re.escape(term) for term in sorted(self.terms, key=len, reverse=True))
+        self._pattern = re.compile(rf'\b(?:{alternatives})\b', re.IGNORECASE)
+
+    @property
+    def key(self) -> str:
+        """The identifier of the phrases and window, company counts of filtered texts are cached under it."""
+
+        # Hash phrases and window
+        digest = hashlib.sha1('\n'.join([str(self.window), *self.terms]).encode('utf-8')).hexdigest()
+
+        return f'relevance-{digest[:12]}'
+
+    def filter(self, text: str) -> str:
+        """This function keeps the passages of an article text that mention the technology.
+
+        :param text: The article text.
+        :return: The sentences mentioning a phrase with their windows, or the lead sentences if there aren't any.
+        """
+
+        # Get sentences
+        sentences = split_sentences(text)
+
+        # The sentences mentioning a phrase
+        matches = [i for i, sentence in enumerate(sentences) if self._pattern.search(sentence)]
+
+        if matches:
+            # Keep each sentence mentioning a phrase with the sentences around it
+            kept = sorted({
+                j
+                for i in matches
+                for j in range(max(i - self.window, 0), min(i + self.window + 1, len(sentences)))
+            })
+            passage = ' '.join(sentences[j] for j in kept)
+        else:
+            # The search matched the article elsewhere, keep its lead
+            passage = ' '.join(sentences[:LEAD_SENTENCES])
+
+        # Count the words NER no longer processes
+        metrics.add('relevance', items=1, words_in=len(text.split()), words_out=len(passage.split()))
+
+        return passage
@@ -0,0 +1,338 @@
+import re
+import math
+import unicodedata
+from threading import Lock
+
+# The legal suffixes that do not tell two companies apart
+LEGAL_SUFFIXES = {
+    'inc', 'incorporated', 'llc', 'llp', 'lp', 'ltd', 'limited', 'corp', 'corporation', 'co', 'company', 'plc',
+    'gmbh', 'ag', 'sa', 'nv', 'bv', 'ab', 'oy', 'spa', 'pte', 'pty', 'kk'
+}
+
+# The words that name no company on their own, such as "Analytics" in "Moody's Analytics"
+GENERIC_WORDS = {
+    'analytics', 'bank', 'brands', 'capital', 'communications', 'consulting', 'energy', 'enterprises', 'financial',
+    'foods', 'global', 'group', 'health', 'holdings', 'industries', 'insurance', 'international', 'investments',
+    'labs', 'laboratories', 'management', 'media', 'motors', 'networks', 'partners', 'pharmaceuticals', 'restaurants',
+    'research', 'services', 'software', 'solutions', 'stores', 'systems', 'technologies', 'technology', 'ventures'
+}
+
+# The owner in front of a company, such as "Alphabet's" in "Alphabet's Google"
+OWNER_PATTERN = re.compile(r"^.+?['’]s\s+(?=\w)")
+
+# The characters that are not part of a name
+PUNCTUATION_PATTERN = re.compile(r'[^\w&+ ]+')
+
+# The share of trigrams two names must have in common to be the same company
+DEFAULT_THRESHOLD = 0.7
+
+
+def normalize_name(name: str) -> str:
+    """This function normalizes the surface form of a company name.
+
+    'Google', 'Google LLC', 'The Google Company' and 'GOOGLE' all become 'google'.
+
+    :param name: The company name, as found by NER.
+    :return: The lowercase name without accents, punctuation, leading 'the' and legal suffixes.
+    """
+
+    # Remove accents
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+
+    # Remove punctuation
+    words = PUNCTUATION_PATTERN.sub(' ', name.casefold()).split()
+
+    # Remove leading 'the'
+    if len(words) > 1 and words[0] == 'the':
+        words = words[1:]
+
+    # Remove legal suffixes, but never the whole name
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words = words[:-1]
+
+    return ' '.join(words)
+
+
+def remove_owner(name: str) -> str:
+    """This function removes the owner in front of a company name, "Alphabet's Google" becomes 'Google'.
+
+    :param name: The company name.
+    :return: The name without its owner, or None if it has none.
+    """
+
+    # Remove owner
+    owned = OWNER_PATTERN.sub('', name.strip())
+
+    return owned if owned != name.strip() else None
+
+
+def is_generic(normalized: str) -> bool:
+    """This function checks if a normalized name is only legal suffixes and generic words, such as 'inc' or 'analytics'.
+
+    :param normalized: The normalized name.
+    :return: If the name names no company on its own.
+    """
+
+    return all(word in LEGAL_SUFFIXES or word in GENERIC_WORDS for word in normalized.split())
+
+
+def get_trigrams(normalized: str) -> set:
+    """This function gets the character trigrams of a normalized name, padded so short names have some.
+
+    :param normalized: The normalized name.
+    :return: The trigrams.
+    """
+
+    # Pad name
+    padded = f'  {normalized} '
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityRegistry:
+    """This class resolves the surface forms of company names to canonical companies.
+
+    Exact matches of the normalized name are looked up in a dictionary. Other names are only compared with the
+    companies sharing one of their trigrams, through a trigram index, so resolving stays fast as the registry grows
+    to hundreds of thousands of names. Names that match no company become canonical companies themselves.
+
+    The canonical name of a company is decided once: the saved aliases are loaded first, and every new normalized
+    name is claimed through the claim function, which returns the name saved first by any process. So a company keeps
+    the same name whatever order its spellings arrive in, and across restarts. The new names of an article are claimed
+    together, outside the lock, so one slow claim never holds up the other threads.
+
+    :param names: The canonical company names to start with, such as the gazetteer.
+    :param threshold: The share of trigrams two names must have in common to be the same company.
+    :param aliases: The saved canonical name of each normalized name.
+    :param claim: The function saving the canonical name of each normalized name of a dictionary unless one is saved,
+        returning the saved ones, or None to keep the names in memory only.
+    """
+
+    def __init__(self, names=(), threshold: float = DEFAULT_THRESHOLD, aliases: dict = None, claim=None):
+        self.threshold = threshold
+        self._claim = claim
+        self._lock = Lock()
+
+        # The canonical name and trigrams of each company, by id, and the id of each canonical name
+        self._names = []
+        self._trigrams = []
+        self._ids = {}
+
+        # The id of each normalized name
+        self._exact = {}
+
+        # The ids of the companies with each trigram
+        self._postings = {}
+
+        # The saved names come first, they were decided before
+        for normalized, name in (aliases or {}).items():
+            self._exact[normalized] = self._index(name)
+
+        self.add_many(names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, aliases=()) -> str:
+        """This function adds a canonical company with its aliases, unless it is already known.
+
+        :param name: The canonical company name.
+        :param aliases: The other names of the company, such as 'Alphabet' for 'Google'.
+        :return: The canonical company name.
+        """
+
+        name = self.add_many([name])[name]
+
+        # Aliases resolve exactly
+        with self._lock:
+            if name in self._ids:
+                for alias in aliases:
+                    self._exact.setdefault(normalize_name(alias), self._ids[name])
+
+        return name
+
+    def add_many(self, names) -> dict:
+        """This function adds canonical companies, unless they are already known, claiming the new ones together.
+
+        :param names: The iterable of canonical company names.
+        :return: The canonical company of each name.
+        """
+
+        names = list(names)
+
+        # The names to claim, the first of each normalized name
+        with self._lock:
+            unclaimed = {}
+
+            for name in names:
+                normalized = normalize_name(name)
+                if normalized and normalized not in self._exact:
+                    unclaimed.setdefault(normalized, name)
+
+        return self._install(names, unclaimed)
+
+    def _claim_many(self, unclaimed: dict) -> dict:
+        # Save the canonical names, outside the lock, getting the ones saved first by any process
+        if self._claim is None or not unclaimed:
+            return unclaimed
+
+        claimed = self._claim(unclaimed)
+
+        return {normalized: claimed.get(normalized, name) for normalized, name in unclaimed.items()}
+
+    def _install(self, names, unclaimed: dict) -> dict:
+        # Claim the new normalized names, then resolve each name exactly
+        claimed = self._claim_many(unclaimed)
+
+        with self._lock:
+            for normalized, name in claimed.items():
+                # Another thread may have installed the name while claiming
+                if normalized not in self._exact:
+                    self._exact[normalized] = self._index(name)
+
+            return {
+                name: self._names[self._exact[normalized]] if (normalized := normalize_name(name)) else name
+                for name in names
+            }
+
+    def _index(self, name: str) -> int:
+        # Get the id of a canonical name, indexing its trigrams the first time
+        if name in self._ids:
+            return self._ids[name]
+
+        i = self._ids[name] = len(self._names)
+        trigrams = get_trigrams(normalize_name(name))
+        self._names.append(name)
+        self._trigrams.append(trigrams)
+
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, []).append(i)
+
+        return i
+
+    def _find(self, normalized: str) -> int:
+        # Exact match
+        if normalized in self._exact:
+            return self._exact[normalized]
+
+        trigrams = get_trigrams(normalized)
+
+        # A company sharing the threshold of the trigrams misses at most this many, so it has one of the rarest
+        # trigrams past them, and only their postings give candidates however common the other trigrams are
+        needed = math.ceil(self.threshold * len(trigrams))
+        rarest = sorted(trigrams, key=lambda trigram: len(self._postings.get(trigram, ())))
+        candidates = set()
+
+        for trigram in rarest[:len(trigrams) - needed + 1]:
+            candidates.update(self._postings.get(trigram, ()))
+
+        # The candidate sharing the largest share of its full trigram set, in id order so ties keep the oldest
+        best, best_score = None, 0.0
+        for i in sorted(candidates):
+            # Names whose sizes differ too much can't share enough trigrams
+            if not needed <= len(self._trigrams[i]) <= len(trigrams) / self.threshold:
+                continue
+
+            count = len(trigrams & self._trigrams[i])
+            score = count / (len(trigrams) + len(self._trigrams[i]) - count)
+            if score > best_score:
+                best, best_score = i, score
+
+        return best if best_score >= self.threshold else None
+
+    def _match(self, name: str) -> str:
+        # Get the canonical company a new name should be claimed for, None if the name is known
+        normalized = normalize_name(name)
+        if not normalized or normalized in self._exact:
+            return None
+
+        i = self._find(normalized)
+
+        # Try the name without its owner, "Alphabet's Google" is Google, but "Macy's Inc" and "Moody's Analytics"
+        # are companies of their own, whose possessive is part of the name
+        owned = remove_owner(name)
+        if i is None and owned is not None and normalize_name(owned) and not is_generic(normalize_name(owned)):
+            i = self._find(normalize_name(owned))
+
+            # Never merge a name into a generic word that was found as a company on its own
+            if i is not None and ' ' not in normalize_name(self._names[i]) and \
+                    is_generic(normalize_name(self._names[i])):
+                i = None
+
+        # A name that matches no company is a company of its own
+        return self._names[i] if i is not None else name
+
+    def resolve(self, name: str) -> str:
+        """This function gets the canonical company of a name, adding it as a new company if none matches.
+
+        :param name: The company name, as found by NER.
+        :return: The canonical company name.
+        """
+
+        return self.resolve_many([name])[name]
+
+    def resolve_many(self, names) -> dict:
+        """This function gets the canonical company of each name, such as every name of an article, adding the names
+        that match no company as new companies.
+
+        Each new surface form resolves exactly next time, and after a restart, once claimed. The new names are claimed
+        together, so an article costs one claim however many new names it has.
+
+        :param names: The iterable of company names, as found by NER.
+        :return: The canonical company of each name.
+        """
+
+        names = list(dict.fromkeys(names))
+
+        # Match the new names, under the lock
+        with self._lock:
+            unclaimed = {}
+
+            # The trigrams of the names of the article that are new companies, not yet in the trigram index
+            new = {}
+
+            for name in names:
+                company = self._match(name)
+                if company is None or normalize_name(name) in unclaimed:
+                    continue
+
+                # A new company may be another spelling of a new company of the same article
+                if company == name:
+                    trigrams = get_trigrams(normalize_name(name))
+
+                    for other, other_trigrams in new.items():
+                        shared = len(trigrams & other_trigrams)
+                        if shared / (len(trigrams) + len(other_trigrams) - shared) >= self.threshold:
+                            company = other
+                            break
+                    else:
+                        new[name] = trigrams
+
+                unclaimed[normalize_name(name)] = company
+
+        return self._install(names, unclaimed)
+
+
+def resolve_companies(companies: dict, registry: EntityRegistry) -> dict:
+    """This function merges the counts of the names of the same company under its canonical name.
+
+    :param companies: The companies stored in a dictionary with counts, keyed by the names found by NER.
+    :param registry: The registry of canonical companies.
+    :return: The companies stored in a dictionary with counts, keyed by canonical name.
+    """
+
+    # The companies dictionary
+    resolved = {}
+
+    # The canonical company of every name of the article at once
+    canonical = registry.resolve_many(companies)
+
+    # Add the counts of each name to its company
+    for name, values in companies.items():
+        company = resolved.setdefault(canonical[name], {})
+
+        for k, v in values.items():
+            company[k] = company.get(k, 0) + v
+
+    return resolved
@@ -0,0 +1,271 @@
+import time
+import queue
+import asyncio
+import threading
+
+# The newscatcherapi search endpoint
+SEARCH_URL = 'https://api.newscatcherapi.com/v2/search'
+
+# The calls per second allowed for one key, the free plan allows one
+DEFAULT_RATE = 1.0
+
+# The number of pages fetched at the same time
+DEFAULT_CONCURRENCY = 4
+
+# The number of times a page is retried before giving up
+DEFAULT_RETRIES = 5
+
+# The seconds to wait for a page
+DEFAULT_TIMEOUT = 30
+
+# The first and longest pause of a key after a rate limit response
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+class KeysExhaustedError(RuntimeError):
+    """This error is raised when every newscatcherapi key ran out of quota."""
+
+
+class KeyPool:
+    """This class rotates newscatcherapi calls across API keys, pacing each key to its rate limit.
+
+    The pool is thread safe and never blocks an event loop, so every search of the process can share it.
+
+    :param keys: The API keys.
+    :param rate: The calls per second allowed for one key.
+    :param budget: The calls allowed for one key, or None for no limit.
+    """
+
+    def __init__(self, keys: list, rate: float = DEFAULT_RATE, budget: int = None):
+        self.rate = rate
+        self._lock = threading.Lock()
+
+        # The state of each key
+        self._keys = {
+            key: {
+                'next_call': 0.0,
+                'backoff': MIN_BACKOFF,
+                'remaining': budget,
+                'exhausted': False,
+                'calls': 0,
+                'rate_limited': 0
+            }
+            for key in keys
+        }
+
+    async def acquire(self) -> str:
+        """This function reserves the next call of the key that is ready first.
+
+        :return: The API key.
+        """
+
+        with self._lock:
+            # The keys that still have quota
+            keys = [k for k, v in self._keys.items() if not v['exhausted']]
+            if not keys:
+                raise KeysExhaustedError('Every newscatcherapi key ran out of quota.')
+
+            # Reserve a call of the key that is ready first
+            key = min(keys, key=lambda k: self._keys[k]['next_call'])
+            state = self._keys[key]
+
+            now = time.monotonic()
+            ready = max(now, state['next_call'])
+            state['next_call'] = ready + 1 / self.rate
+            state['calls'] += 1
+
+            # Stop using the key once its budget is spent
+            if state['remaining'] is not None:
+                state['remaining'] -= 1
+                if state['remaining'] <= 0:
+                    state['exhausted'] = True
+
+        # Wait for the reserved call without blocking other searches
+        await asyncio.sleep(ready - now)
+
+        return key
+
+    def rate_limited(self, key: str, retry_after: float = None) -> None:
+        """This function pauses a key after a rate limit response, longer each time in a row.
+
+        :param key: The API key.
+        :param retry_after: The seconds the API asked to wait, if any.
+        """
+
+        with self._lock:
+            state = self._keys[key]
+            pause = retry_after if retry_after is not None else state['backoff']
+
+            state['next_call'] = max(state['next_call'], time.monotonic() + pause)
+            state['backoff'] = min(state['backoff'] * 2, MAX_BACKOFF)
+            state['rate_limited'] += 1
+
+    def succeeded(self, key: str) -> None:
+        """This function resets the backoff of a key after a successful call.
+
+        :param key: The API key.
+        """
+
+        with self._lock:
+            self._keys[key]['backoff'] = MIN_BACKOFF
+
+    def exhausted(self, key: str) -> None:
+        """This function stops using a key that ran out of quota.
+
+        :param key: The API key.
+        """
+
+        with self._lock:
+            self._keys[key]['exhausted'] = True
+
+    def stats(self) -> list:
+        """This function gets the calls, rate limits and remaining budget of each key.
+
+        :return: The statistics of each key, without the key itself.
+        """
+
+        with self._lock:
+            return [
+                {k: v for k, v in state.items() if k != 'next_call'}
+                for state in self._keys.values()
+            ]
+
+
+async def search_page(session: 'aiohttp.ClientSession', pool: KeyPool, params: dict, page: int,
+                      retries: int = DEFAULT_RETRIES) -> dict:
+    """This function fetches one newscatcherapi search page, rotating keys on rate limit and quota errors.
+
+    :param session: The HTTP session.
+    :param pool: The pool of API keys.
+    :param params: The search parameters.
+    :param page: The page number.
+    :param retries: The number of times the page is retried.
+    :return: The search response.
+    """
+
+    import aiohttp
+
+    for attempt in range(retries + 1):
+        # Get the key that is ready first
+        key = await pool.acquire()
+
+        try:
+            async with session.get(SEARCH_URL, params={**params, 'page': page}, headers={'x-api-key': key}) as response:
+                # Rate limited, pause this key and try another one
+                if response.status == 429:
+                    retry_after = response.headers.get('Retry-After')
+                    pool.rate_limited(key, float(retry_after) if retry_after else None)
+                    continue
+
+                # Quota spent or key revoked, never use this key again
+                if response.status in (401, 403):
+                    pool.exhausted(key)
+                    continue
+
+                response.raise_for_status()
+                pool.succeeded(key)
+
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Network error or server error, pause this key and retry
+            pool.rate_limited(key)
+
+    raise RuntimeError(f'newscatcherapi page {page} failed {retries + 1} times.')
+
+
+async def iter_search_pages(pool: KeyPool, q: str, from_: str, to_: str, lang: str = 'en', page_size: int = 100,
+                            concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT):
+    """This function fetches every newscatcherapi search page, up to concurrency pages at the same time.
+
+    :param pool: The pool of API keys.
+    :param q: The search query.
+    :param from_: The first date, YYYY/mm/dd.
+    :param to_: The last date, YYYY/mm/dd.
+    :param lang: The language of the articles.
+    :param page_size: The number of articles per page.
+    :param concurrency: The number of pages fetched at the same time.
+    :param timeout: The seconds to wait for a page.
+    :return: An async generator of the articles list of each page, in the order pages arrive.
+    """
+
+    # Imported on the first search, so the app starts without loading aiohttp
+    import aiohttp
+
+    # The search parameters
+    params = {'q': q, 'lang': lang, 'page_size': page_size, 'from': from_, 'to': to_}
+
+    # Limit the pages fetched at the same time
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(page: int) -> dict:
+        async with semaphore:
+            return await search_page(session, pool, params, page)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        # The first page tells the number of pages
+        response = await fetch(1)
+        yield response.get('articles') or []
+
+        # Fetch the other pages concurrently
+        tasks = [asyncio.ensure_future(fetch(page)) for page in range(2, (response.get('total_pages') or 0) + 1)]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                response = await task
+                yield response.get('articles') or []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def search_pages(pool: KeyPool, q: str, from_: str, to_: str, **kwargs):
+    """This function fetches every newscatcherapi search page from synchronous code.
+
+    The event loop runs in its own thread and hands each page over as soon as it arrives.
+
+    :param pool: The pool of API keys.
+    :param q: The search query.
+    :param from_: The first date, YYYY/mm/dd.
+    :param to_: The last date, YYYY/mm/dd.
+    :param kwargs: The other arguments of iter_search_pages.
+    :return: A generator of the articles list of each page.
+    """
+
+    # The pages waiting to be handed over
+    pages = queue.Queue()
+
+    # The marker of the last page
+    done = object()
+
+    # Set when the caller stops early
+    stop = threading.Event()
+
+    async def run():
+        try:
+            async for articles in iter_search_pages(pool, q, from_, to_, **kwargs):
+                if stop.is_set():
+                    break
+                pages.put((articles, None))
+        except Exception as e:
+            pages.put((done, e))
+        else:
+            pages.put((done, None))
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            articles, error = pages.get()
+
+            if articles is done:
+                if error is not None:
+                    raise error
+
+                return
+
+            yield articles
+    finally:
+        stop.set()
@@ -0,0 +1,83 @@
+import logging
+import numpy as np
+from threading import Lock
+
+# The normalization constant of VADER, scores tend to -1 and 1 as the valence of a sentence grows
+ALPHA = 15
+
+# The VADER lexicon of this process, loaded on first use, False if it is not installed
+_lexicon = None
+
+# The lock so two threads never load the lexicon twice
+_lexicon_lock = Lock()
+
+
+def get_lexicon() -> dict:
+    """This function gets the VADER lexicon of nltk, which must be installed beforehand.
+
+    It is never downloaded here, since several NER workers would download it into the same directory at once and the
+    offline benchmark would need the network. Without it, companies are counted without sentiment.
+
+    :return: The valence of each lowercase word, or None if the lexicon is not installed.
+    """
+
+    global _lexicon
+
+    with _lexicon_lock:
+        if _lexicon is None:
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+            try:
+                _lexicon = SentimentIntensityAnalyzer().lexicon
+            except LookupError:
+                logging.getLogger(__name__).warning(
+                    'The VADER lexicon of nltk is not installed, companies are counted without sentiment. Install it '
+                    'once with "python -m nltk.downloader vader_lexicon".'
+                )
+                _lexicon = False
+
+    return _lexicon or None
+
+
+def score_sentences(doc: 'spacy.tokens.Doc', lexicon: dict) -> (np.ndarray, np.ndarray):
+    """This function scores every sentence of a document at once from the valence of its words.
+
+    It sums the VADER valence of the words of each sentence and normalizes the sums like VADER, without its negation
+    and intensifier rules, so the whole document is scored with a few array operations.
+
+    :param doc: The spaCy document, with sentence boundaries.
+    :param lexicon: The valence of each lowercase word.
+    :return: The score of each sentence, between -1 and 1, and the first token of each sentence.
+    """
+
+    # The first token of each sentence
+    starts = np.fromiter((sentence.start for sentence in doc.sents), dtype=np.int64)
+
+    # The valence of each token
+    valences = np.fromiter((lexicon.get(token.lower_, 0.0) for token in doc), dtype=np.float64, count=len(doc))
+
+    # Sum valences per sentence and normalize
+    sums = np.add.reduceat(valences, starts) if len(starts) else np.empty(0)
+
+    return sums / np.sqrt(sums * sums + ALPHA), starts
+
+
+def score_mentions(doc: 'spacy.tokens.Doc', mentions: list, lexicon: dict) -> np.ndarray:
+    """This function scores each mention of a company by the sentence it appears in.
+
+    :param doc: The spaCy document, with sentence boundaries.
+    :param mentions: The entities mentioning companies.
+    :param lexicon: The valence of each lowercase word.
+    :return: The score of the sentence of each mention.
+    """
+
+    if not mentions:
+        return np.empty(0)
+
+    # Score sentences
+    scores, starts = score_sentences(doc, lexicon)
+
+    # Find the sentence of each mention
+    sentences = np.searchsorted(starts, [mention.start for mention in mentions], side='right') - 1
+
+    return scores[sentences]
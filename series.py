@@ -0,0 +1,71 @@
+import math
+import numpy as np
+from datetime import date, timedelta
+
+# The rolling windows of the company mentions, in days
+WINDOWS = (7, 30, 90)
+
+# The number of days forecast
+DEFAULT_HORIZON = 7
+
+# The days the lookups of a trend need, the growth compares the last week with the one before
+LOOKBACKS = (0, 7, 14, 30, 90)
+
+
+def get_lookback_dates(day: date) -> dict:
+    """This function gets the dates whose cumulative counts give the rolling windows of a day.
+
+    :param day: The day.
+    :return: The date string, YYYYMMDD, of each lookback in days.
+    """
+
+    return {days: (day - timedelta(days=days)).strftime('%Y%m%d') for days in LOOKBACKS}
+
+
+def compute_trend(count: int, cumulative: dict) -> dict:
+    """This function computes the rolling sums, growth rate and z-score of a company from its prefix sums.
+
+    A window sum is the difference of two cumulative counts, so every trend is computed from a few lookups however
+    long the history is. Days without mentions count as zero.
+
+    :param count: The count of the company on the day.
+    :param cumulative: The (Cumulative, CumulativeSquares) of the company up to each lookback, keyed by days.
+    :return: The 7, 30 and 90-day sums, the growth of the last week over the one before, and the z-score of the day
+        against the last 90 days.
+    """
+
+    # The sum of a window ending on the day
+    def window(days: int, index: int = 0) -> float:
+        return cumulative[0][index] - cumulative[days][index]
+
+    trend = {f'Sum{days}': window(days) for days in WINDOWS}
+
+    # Growth of the last week over the week before
+    previous = cumulative[7][0] - cumulative[14][0]
+    trend['Growth'] = (trend['Sum7'] - previous) / max(previous, 1)
+
+    # Z-score of the day against the mean and standard deviation of the last 90 days
+    mean = window(90) / 90
+    variance = max(window(90, 1) / 90 - mean * mean, 0.0)
+    trend['ZScore'] = (count - mean) / math.sqrt(variance) if variance else 0.0
+
+    return trend
+
+
+def forecast(counts: list, horizon: int = DEFAULT_HORIZON) -> list:
+    """This function forecasts the daily counts of a company with a linear trend.
+
+    :param counts: The daily counts, oldest first.
+    :param horizon: The number of days forecast.
+    :return: The forecast counts of the next days, never negative.
+    """
+
+    # A trend needs two days
+    if len(counts) < 2:
+        return [float(counts[-1]) if counts else 0.0] * horizon
+
+    # Fit a line through the daily counts
+    days = np.arange(len(counts))
+    slope, intercept = np.polyfit(days, np.asarray(counts, dtype=np.float64), deg=1)
+
+    return [max(float(slope * day + intercept), 0.0) for day in range(len(counts), len(counts) + horizon)]
@@ -0,0 +1,175 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+from threading import Lock
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# The default location of the article text cache
+DEFAULT_PATH = os.path.join('.cache', 'articles.sqlite')
+
+# The default size of the article text cache, 1 GB
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# The query parameters that only track clicks and never change the article
+TRACKING_PARAMETERS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'cmpid', 'ocid')
+
+
+def normalize_url(url: str) -> str:
+    """This function normalizes an article url so copies of the same link share one cache entry.
+
+    :param url: The article url.
+    :return: The normalized url.
+    """
+
+    # Split url
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+
+    # Drop tracking parameters and sort the rest
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMETERS)
+    ))
+
+    # Lowercase scheme and host, drop 'www.', the trailing slash and the fragment
+    netloc = netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    path = path.rstrip('/') or '/'
+
+    return urlunsplit((scheme.lower(), netloc, path, query, ''))
+
+
+def url_key(url: str) -> str:
+    """This function hashes the normalized article url.
+
+    :param url: The article url.
+    :return: The SHA-256 hex digest of the normalized url.
+    """
+
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+class TextCache:
+    """This class stores extracted article texts on disk, evicting the least recently used ones.
+
+    :param path: The location of the SQLite cache file.
+    :param max_bytes: The maximum size of the stored texts.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        # Create the cache directory
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # The connection is shared by the Streamlit script threads, so guard it with a lock
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS articles ('
+            'key TEXT PRIMARY KEY, url TEXT, text BLOB, size INTEGER, last_access REAL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS articles_last_access ON articles (last_access)')
+        self._connection.commit()
+
+        # The size of the stored texts
+        self.size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM articles').fetchone()[0]
+
+    def get(self, url: str):
+        """This function gets the article text from the cache.
+
+        :param url: The article url.
+        :return: The article text, or None if it was never stored.
+        """
+
+        # Get key
+        key = url_key(url)
+
+        with self._lock:
+            row = self._connection.execute('SELECT text FROM articles WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            # Mark article as recently used
+            self._connection.execute('UPDATE articles SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+            self.hits += 1
+
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, url: str, text: str) -> None:
+        """This function stores the article text in the cache.
+
+        :param url: The article url.
+        :param text: The article text.
+        """
+
+        # Compress text
+        blob = zlib.compress(text.encode('utf-8'))
+
+        # Get key
+        key = url_key(url)
+
+        with self._lock:
+            # Take the write lock of the file first, the app and batch.py share it, so the size is read and enforced
+            # with the writes of every process
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                # Replace the previous text of the article
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO articles (key, url, text, size, last_access) VALUES (?, ?, ?, ?, ?)',
+                    (key, url, blob, len(blob), time.time())
+                )
+
+                # The size of the texts stored by every process
+                self.size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM articles').fetchone()[0]
+
+                # Evict the least recently used articles until the cache fits
+                while self.size > self.max_bytes:
+                    oldest = self._connection.execute(
+                        'SELECT key, size FROM articles ORDER BY last_access LIMIT 1'
+                    ).fetchone()
+                    if oldest is None:
+                        break
+
+                    self._connection.execute('DELETE FROM articles WHERE key = ?', (oldest[0],))
+                    self.size -= oldest[1]
+
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+
+    def stats(self) -> dict:
+        """This function gets the cache hit and miss counters.
+
+        :return: The hits, misses, hit rate, number of articles and size in bytes.
+        """
+
+        with self._lock:
+            count, self.size = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM articles'
+            ).fetchone()
+
+        # The fraction of lookups served from the cache
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': hit_rate,
+            'articles': count,
+            'bytes': self.size
+        }